@@ -11,7 +11,7 @@ import ShopPage from './pages/ShopPage';
 import ProductDetailPage from './pages/ProductDetailPage';
 import CartPage from './pages/CartPage';
 import OrderConfirmationPage from './pages/OrderConfirmationPage';
-import { getCart, addToCart as apiAddToCart } from './lib/api';
+import { getCart, addToCart as apiAddToCart, bootstrapSession, fetchSearchSuggestions, SearchSuggestion } from './lib/api';
 import LuxuryLoader from './components/LuxuryLoader';
 import WishlistDrawer from './components/WishlistDrawer';
 
@@ -23,7 +23,10 @@ const App: React.FC = () => {
   const [notification, setNotification] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState('');
+  const [suggestions, setSuggestions] = useState<SearchSuggestion[]>([]);
   const [isWishlistOpen, setIsWishlistOpen] = useState(false);
+  // Wishlist product ids from the bootstrap call; null until it has answered
+  const [wishlistIds, setWishlistIds] = useState<string[] | null>(null);
   const navigate = useNavigate();
 
   const handleSearch = (e: React.FormEvent | React.KeyboardEvent) => {
@@ -36,6 +39,15 @@ const App: React.FC = () => {
     }
   };
 
+  useEffect(() => {
+    // Suggestions come from the static search index, filtered in the browser (no API call per keystroke)
+    let cancelled = false;
+    fetchSearchSuggestions(searchQuery).then(results => {
+      if (!cancelled) setSuggestions(results);
+    }).catch(() => setSuggestions([]));
+    return () => { cancelled = true; };
+  }, [searchQuery]);
+
   useEffect(() => {
     // Ensure loader stays for at least 2.5 seconds for the "luxury" feel
     const timer = setTimeout(() => {
@@ -47,8 +59,9 @@ const App: React.FC = () => {
 
   useEffect(() => {
     // Initial Cart Load - Backend will assign session cookie if missing
-    getCart().then(items => {
-      setCart(items.filter(i => i.quantity > 0));
+    bootstrapSession().then(session => {
+      setCart(session.cart.filter(i => i.quantity > 0));
+      setWishlistIds(session.wishlist);
     }).catch(console.error);
   }, []);
 
@@ -154,7 +167,7 @@ const App: React.FC = () => {
           </Link>
 
           {/* Search Bar - Centered */}
-          <div className="flex-1 max-w-2xl hidden md:flex">
+          <div className="flex-1 max-w-2xl hidden md:flex relative">
             <div className="flex w-full bg-background-cream rounded-full border border-stone-200 px-4 py-2 items-center gap-2 focus-within:border-accent-terra transition-colors">
               <select className="bg-transparent border-none text-xs font-bold text-primary uppercase focus:ring-0 p-0 cursor-pointer outline-none">
                 <option>Categories</option>
@@ -177,6 +190,23 @@ const App: React.FC = () => {
                 <span className="material-symbols-outlined !text-sm">search</span>
               </button>
             </div>
+            {suggestions.length > 0 && (
+              <ul className="absolute top-full left-0 right-0 mt-2 bg-white rounded-2xl border border-stone-200 shadow-lg overflow-hidden z-50">
+                {suggestions.map(suggestion => (
+                  <li key={suggestion.id}>
+                    <Link
+                      to={`/product/${suggestion.id}`}
+                      onClick={() => setSearchQuery('')}
+                      className="flex items-center gap-3 px-4 py-2 hover:bg-background-cream transition-colors"
+                    >
+                      <img src={suggestion.image_url} alt="" className="w-8 h-8 rounded-full object-cover" />
+                      <span className="flex-1 text-sm text-primary">{suggestion.name}</span>
+                      <span className="text-xs font-bold text-stone-400">${suggestion.price.toFixed(2)}</span>
+                    </Link>
+                  </li>
+                ))}
+              </ul>
+            )}
           </div>
 
           {/* Right Icons */}
@@ -223,6 +253,8 @@ const App: React.FC = () => {
         isOpen={isWishlistOpen}
         onClose={() => setIsWishlistOpen(false)}
         onAddToCart={addToCart}
+        wishlistIds={wishlistIds}
+        onWishlistChange={setWishlistIds}
       />
       <AnimatePresence>
         {notification && (
@@ -241,7 +273,7 @@ const App: React.FC = () => {
       <Routes>
         <Route path="/" element={<HomePage onQuickLook={setQuickLookProduct} />} />
         <Route path="/shop" element={<ShopPage onQuickLook={setQuickLookProduct} />} />
-        <Route path="/product/:id" element={<ProductDetailPage addToCart={addToCart} />} />
+        <Route path="/product/:id" element={<ProductDetailPage addToCart={addToCart} wishlistIds={wishlistIds} onWishlistChange={setWishlistIds} />} />
         <Route path="/cart" element={<CartPage cart={cart} removeFromCart={removeFromCart} updateQuantity={updateQuantity} />} />
         <Route path="/order-confirmation" element={<OrderConfirmationPage />} />
       </Routes>
@@ -0,0 +1,21 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+# Shared secret for operator-only endpoints. Unset means every admin endpoint is locked.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    if not ADMIN_TOKEN or not token:
+        return False
+    # Constant-time comparison so the token can't be guessed byte by byte
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """FastAPI dependency: reject the request unless it carries the admin token."""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
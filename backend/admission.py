@@ -0,0 +1,196 @@
+"""Admission control: per-route-class bulkheads, priorities and queue-time budgets.
+
+Every request is put in a class by path. Each class has a concurrency limit,
+and all classes share ADMISSION_MAX_CONCURRENCY slots (by default the size of
+the anyio threadpool the sync handlers run on). When slots free up, waiting
+requests are admitted in class priority order: revenue first, bulk exports last.
+
+Each class also has a queue-time budget. A request whose estimated wait
+(queue length x recent service time / class limit) is already over budget is
+rejected on arrival. A request that waits out its budget is rejected then. Both
+get 503 with Retry-After, so a flood of image or search traffic sheds its own
+requests instead of queueing in front of checkout.
+
+    ADMISSION_MEDIA=4:250       # class concurrency limit : queue budget in ms
+
+Shed counts, queue time and in-flight counts per class are exported on /metrics.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+from instrumentation import METRICS
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "40"))
+
+# name: (priority, concurrency limit, queue budget ms). Lower priority is served first.
+# The non-revenue limits add up to less than the global limit, so checkout always has headroom.
+DEFAULT_CLASSES = {
+    "revenue": (0, 16, 2000),
+    "admin": (1, 2, 5000),
+    "catalog": (2, 24, 500),
+    "media": (3, 4, 250),
+    # Streaming exports run for minutes: kept apart so they never hold admin slots
+    # or skew the admin service time, and shed on arrival once both are busy
+    "bulk": (4, 2, 1000),
+}
+
+# First matching path prefix (whole path segments) wins; anything else is "catalog"
+ROUTE_CLASSES = [
+    ("/api/stream", None),  # Long-lived SSE connections hold no thread; never queued
+    ("/metrics", None),  # Monitoring has to keep working under overload
+    ("/api/admin/profile", None),  # A profiling window is an async sleep and holds no thread
+    ("/api/admin/export", "bulk"),
+    ("/api/admin", "admin"),
+    ("/api/checkout", "revenue"),
+    ("/api/cart", "revenue"),
+    ("/api/optimize-image", "media"),
+]
+
+METRICS.describe("admission_queue_seconds", "histogram", "Time requests waited for admission by class")
+METRICS.describe("admission_shed_total", "counter", "Requests rejected with 503 by class and reason")
+METRICS.describe("admission_in_flight", "gauge", "Requests currently admitted by class")
+
+
+def classify(path):
+    for prefix, route_class in ROUTE_CLASSES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return route_class
+    return "catalog"
+
+
+def classes_from_env():
+    classes = {}
+    for name, (priority, limit, budget_ms) in DEFAULT_CLASSES.items():
+        override = os.getenv(f"ADMISSION_{name.upper()}")
+        if override:
+            limit, _, budget = override.partition(":")
+            limit, budget_ms = int(limit), float(budget or budget_ms)
+        classes[name] = (priority, limit, budget_ms / 1000)
+    return classes
+
+
+class Shed(Exception):
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Slot accounting. Runs on the event loop only, so needs no locks."""
+
+    def __init__(self, classes, max_concurrency):
+        self.classes = classes
+        self.max_concurrency = max_concurrency
+        self.by_priority = sorted(classes, key=lambda name: classes[name][0])
+        self.active = {name: 0 for name in classes}
+        self.total = 0
+        self.waiters = {name: deque() for name in classes}
+        self.service_time = {name: 0.05 for name in classes}  # EWMA seconds, seeded at 50 ms
+
+    def _has_slot(self, name):
+        return self.active[name] < self.classes[name][1] and self.total < self.max_concurrency
+
+    def _grant(self, name):
+        self.active[name] += 1
+        self.total += 1
+        METRICS.set("admission_in_flight", (("class", name),), self.active[name])
+
+    def estimated_wait(self, name):
+        return (len(self.waiters[name]) + 1) * self.service_time[name] / self.classes[name][1]
+
+    async def acquire(self, name):
+        """Wait for a slot in `name`. Returns the seconds waited; raises Shed."""
+        # Waiters of the same class go first; other classes only wait on their own limits
+        if not self.waiters[name] and self._has_slot(name):
+            self._grant(name)
+            return 0.0
+
+        budget = self.classes[name][2]
+        estimate = self.estimated_wait(name)
+        if estimate > budget:
+            raise Shed("queue_full", estimate)
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[name].append(waiter)
+        try:
+            await asyncio.wait_for(waiter, budget)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the budget ran out or the client went away
+                if isinstance(error, asyncio.TimeoutError):
+                    return time.perf_counter() - started
+                self.release(name)
+                raise
+            try:
+                self.waiters[name].remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(error, asyncio.TimeoutError):
+                raise Shed("timeout", max(estimate, budget))
+            raise
+        return time.perf_counter() - started
+
+    def release(self, name, service_time=None):
+        self.active[name] -= 1
+        self.total -= 1
+        METRICS.set("admission_in_flight", (("class", name),), self.active[name])
+        if service_time is not None:
+            self.service_time[name] += 0.2 * (service_time - self.service_time[name])
+        self._wake()
+
+    def _wake(self):
+        # Hand freed slots to waiters in priority order
+        for name in self.by_priority:
+            queue = self.waiters[name]
+            while queue and self._has_slot(name):
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self._grant(name)
+                    waiter.set_result(None)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI. Sits inside PerfMiddleware so queue time shows up in request latency."""
+
+    def __init__(self, app, classes=None, max_concurrency=ADMISSION_MAX_CONCURRENCY):
+        self.app = app
+        self.controller = AdmissionController(classes or classes_from_env(), max_concurrency)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = classify(scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        labels = (("class", name),)
+        try:
+            waited = await self.controller.acquire(name)
+        except Shed as shed:
+            METRICS.inc("admission_shed_total", labels + (("reason", shed.reason),))
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": str(max(1, math.ceil(shed.retry_after)))},
+            )
+            return await response(scope, receive, send)
+
+        METRICS.observe("admission_queue_seconds", labels, waited)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.perf_counter() - started)
+
+
+def install(app):
+    """Add the admission middleware unless ADMISSION_ENABLED=0."""
+    if ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware)
@@ -0,0 +1,201 @@
+"""In-process micro-benchmarks at increasing data scale.
+
+For each tier a synthetic database is generated once (see synthetic_data.py) and
+cached under .bench/. Every run works on a fresh copy of it, drives the FastAPI
+app in-process through TestClient and reports per endpoint: latency
+percentiles, peak / total allocations (tracemalloc) and SQL statements and rows
+per request (from the Server-Timing header).
+
+    python bench.py                       # 1k and 10k tiers
+    python bench.py --tiers 1k,10k,100k,1m --out bench.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import tracemalloc
+
+# Every benchmark call comes from one client; limits would only measure 429s
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from database import create_db_engine, sqlite_maintenance
+import main
+import models
+import synthetic_data
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bench")
+TIMING_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) statements, (\d+) rows"')
+
+
+def cases(config):
+    """(name, method, path, body, needs_cart) for every benchmarked endpoint."""
+    mid_id = config["products"] // 2
+    return [
+        ("get_products", "GET", "/api/products", None, False),
+        ("get_products_filtered", "GET", "/api/products?category=Roasted&min_price=10&max_price=12&sort_by=price_asc", None, False),
+        ("get_product", "GET", f"/api/products/{mid_id}", None, False),
+        ("search_products", "GET", "/api/search?q=Truffle%20Pecans%201", None, False),
+        ("get_cart", "GET", "/api/cart", None, False),
+        ("get_wishlist", "GET", "/api/wishlist", None, False),
+        ("session_bootstrap", "GET", "/api/session/bootstrap", None, False),
+        ("add_to_cart", "POST", "/api/cart", {"product_id": mid_id, "quantity": 1}, False),
+        ("checkout", "POST", "/api/checkout", {"customer_name": "Bench", "email": "bench@example.com", "address": "1 Bench St", "city": "Perf"}, True),
+    ]
+
+
+def schema_hash():
+    """Short hash of the SQLite DDL for every model, so a schema change regenerates the cached databases."""
+    dialect = sqlite.dialect()
+    ddl = []
+    for table in models.Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in sorted(table.indexes, key=lambda i: i.name))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()[:12]
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def tier_database(tier, seed):
+    """Return the path of a pristine generated database for `tier`, generating it if needed."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"{tier}-seed{seed}-{schema_hash()}.db")
+    if not os.path.exists(path):
+        stale_paths = glob.glob(os.path.join(BENCH_DIR, f"{tier}-seed{seed}.db"))
+        stale_paths += glob.glob(os.path.join(BENCH_DIR, f"{tier}-seed{seed}-*.db"))
+        for stale in stale_paths:
+            remove_database(stale)  # Generated for an older schema
+        print(f"Generating {tier} tier (one-off)...")
+        tmp_path = f"{path}.tmp"
+        engine = create_db_engine(f"sqlite:///{tmp_path}")
+        started = time.perf_counter()
+        counts = synthetic_data.generate(engine, seed=seed, **synthetic_data.TIERS[tier])
+        sqlite_maintenance(engine)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        engine.dispose()
+        os.replace(tmp_path, path)
+        remove_database(tmp_path)  # Checkpointed and truncated above; only the empty -wal/-shm are left
+        print(f"  {counts} in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def run_case(client, method, path, body, session_ids, iterations, max_seconds):
+    latencies, statements, rows = [], [], []
+    deadline = time.perf_counter() + max_seconds
+    for i in range(iterations):
+        client.cookies.set("session_id", next(session_ids))
+        started = time.perf_counter()
+        response = client.request(method, path, json=body)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}: {response.text[:200]}")
+        match = TIMING_RE.search(response.headers.get("server-timing", ""))
+        if match:
+            statements.append(int(match.group(1)))
+            rows.append(int(match.group(2)))
+        if time.perf_counter() > deadline:
+            break
+
+    # Allocations are measured on a separate call so tracing doesn't skew the timings
+    client.cookies.set("session_id", next(session_ids))
+    tracemalloc.start()
+    client.request(method, path, json=body)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "max_ms": max(latencies),
+        "alloc_peak_kb": peak / 1024,
+        "alloc_retained_kb": current / 1024,
+        "statements": max(statements) if statements else None,
+        "rows": max(rows) if rows else None,
+    }
+
+
+def bench_tier(tier, seed, iterations, max_seconds):
+    config = synthetic_data.TIERS[tier]
+    pristine = tier_database(tier, seed)
+    work_path = os.path.join(BENCH_DIR, f"{tier}-run.db")
+    shutil.copyfile(pristine, work_path)  # Writes (cart, checkout) never touch the cached copy
+
+    engine = create_db_engine(f"sqlite:///{work_path}")
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = get_bench_db
+    results = {}
+    try:
+        client = TestClient(main.app)
+        with engine.connect() as conn:
+            # Checkout empties the cart it uses, so every call gets its own non-empty cart
+            cart_sessions = [row[0] for row in conn.exec_driver_sql(
+                "SELECT DISTINCT session_id FROM cart_items ORDER BY session_id LIMIT ?", (iterations + 1,)
+            )]
+        for name, method, path, body, needs_cart in cases(config):
+            if needs_cart:
+                session_ids = iter(cart_sessions)
+            else:
+                session_ids = (synthetic_data.session_id(i % config["sessions"]) for i in range(10**9))
+            results[name] = run_case(client, method, path, body, session_ids, iterations, max_seconds)
+            r = results[name]
+            print(f"  {name:<24} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+                  f"peak {r['alloc_peak_kb']:10.0f} KiB  stmts {r['statements']!s:>4}  rows {r['rows']!s:>8}")
+    finally:
+        main.app.dependency_overrides.pop(main.get_db, None)
+        engine.dispose()
+        remove_database(work_path)
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", default="1k,10k", help=f"comma-separated, from {', '.join(synthetic_data.TIERS)}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=30, help="max calls per endpoint")
+    parser.add_argument("--max-seconds", type=float, default=10, help="time budget per endpoint")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    report = {}
+    for tier in args.tiers.split(","):
+        if tier not in synthetic_data.TIERS:
+            parser.error(f"unknown tier {tier!r}")
+        print(f"\n== {tier} ==")
+        report[tier] = bench_tier(tier, args.seed, args.iterations, args.max_seconds)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
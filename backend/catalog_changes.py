@@ -0,0 +1,274 @@
+"""Catalog change feed: cross-worker invalidation for in-process product caches.
+
+Every product write appends (product_id) rows to catalog_changes in the same
+transaction, so a change is logged if and only if it commits. The highest id is
+the catalog version. ORM writes (checkout's stock deduction, admin edits) are
+logged by a Session hook; Core writers (update_products.py, import_catalog.py)
+call record_changes() themselves.
+
+Each worker runs one ChangeFeed thread that reads new rows and tells its
+subscribers which products changed:
+- SQLite: polls `id > version` every CATALOG_POLL_INTERVAL_MS (one PK range read).
+- Postgres: LISTEN catalog_changes; writers NOTIFY on commit, which wakes the
+  feed immediately. It still polls every CATALOG_PG_POLL_INTERVAL_MS as a backstop.
+
+Each read takes at most PRODUCT_CACHE_SIZE rows. A larger backlog (a bulk import,
+a feed that fell behind) isn't worth reading row by row: the feed jumps to the
+current version and tells subscribers that everything changed (product_ids None),
+so caches just clear.
+
+Postgres sequence values can commit out of order, so there each read looks
+back LOOKBACK ids and skips the ones already seen. A change is therefore seen by
+every worker within one poll interval (or one NOTIFY) of its commit. The worker
+that made an ORM change doesn't wait for that: its own caches are invalidated as
+soon as the session commits.
+"""
+import os
+import select as select_module
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+
+import models
+
+CATALOG_POLL_INTERVAL = float(os.getenv("CATALOG_POLL_INTERVAL_MS", "500")) / 1000
+CATALOG_PG_POLL_INTERVAL = float(os.getenv("CATALOG_PG_POLL_INTERVAL_MS", "5000")) / 1000
+CATALOG_CHANGES_RETENTION = timedelta(hours=float(os.getenv("CATALOG_CHANGES_RETENTION_HOURS", "24")))
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+NOTIFY_CHANNEL = "catalog_changes"
+LOOKBACK = 1000  # ids re-read on every poll to catch out-of-order commits
+PRUNE_INTERVAL = 600  # seconds
+
+changes = models.CatalogChange.__table__
+
+
+def record_changes(conn, product_ids):
+    """Log changes to `product_ids` inside the caller's transaction (for Core writers)."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    now = datetime.utcnow()
+    conn.execute(insert(changes), [{"product_id": product_id, "changed_at": now} for product_id in product_ids])
+    if conn.dialect.name == "postgresql":
+        # Delivered on commit; identical notifications in one transaction are folded into one
+        conn.exec_driver_sql(f"NOTIFY {NOTIFY_CHANNEL}")
+
+
+@event.listens_for(Session, "after_flush")
+def _log_product_changes(session, flush_context):
+    # After the flush, new/dirty/deleted and attribute history still describe what was flushed
+    product_ids = set()
+    for instance in session.new:
+        if isinstance(instance, models.Product):
+            product_ids.add(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, models.Product):
+            product_ids.add(instance.id)
+    for instance in session.dirty:
+        if isinstance(instance, models.Product) and session.is_modified(instance, include_collections=False):
+            product_ids.add(instance.id)
+    if product_ids:
+        record_changes(session.connection(), product_ids)
+        session.info.setdefault("changed_product_ids", set()).update(product_ids)
+
+
+# Product caches in this process, invalidated directly by local commits
+_local_caches = weakref.WeakSet()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_local_caches(session):
+    product_ids = session.info.pop("changed_product_ids", None)
+    if product_ids:
+        for cache in list(_local_caches):
+            cache.invalidate(product_ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_changes(session, previous_transaction):
+    session.info.pop("changed_product_ids", None)
+
+
+def current_version(conn):
+    return conn.execute(select(func.max(changes.c.id))).scalar() or 0
+
+
+class ChangeFeed:
+    """Follows catalog_changes and calls subscribers with the set of changed product ids."""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.version = None  # highest change id seen; None until the first successful read
+        self.last_read = 0.0  # monotonic time of the last successful read
+        self.subscribers = []
+        self._seen = deque()
+        self._seen_ids = set()
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """callback(product_ids, version) runs on the feed thread; keep it short.
+
+        product_ids is None when too many changed to list: treat every product as changed.
+        """
+        self.subscribers.append(callback)
+
+    @property
+    def interval(self):
+        return CATALOG_PG_POLL_INTERVAL if self.bind.dialect.name == "postgresql" else CATALOG_POLL_INTERVAL
+
+    def is_current(self):
+        """True while the feed keeps up, i.e. caches may trust that they've seen every change."""
+        return self.version is not None and time.monotonic() - self.last_read < 3 * self.interval
+
+    def poll(self):
+        """Read changes committed since the last poll and dispatch them."""
+        with self.bind.connect() as conn:
+            if self.version is None:
+                # Start from now: there is nothing cached yet that older changes could invalidate
+                self.version = current_version(conn)
+                self.last_read = time.monotonic()
+                return
+            # SQLite has a single writer, so ids commit in order there and need no lookback
+            lookback = LOOKBACK if conn.dialect.name == "postgresql" else 0
+            page = lookback + PRODUCT_CACHE_SIZE
+            rows = conn.execute(
+                select(changes.c.id, changes.c.product_id)
+                .where(changes.c.id > self.version - lookback)
+                .order_by(changes.c.id)
+                .limit(page)
+            ).all()
+            if len(rows) == page:
+                # At least a cache's worth of changes behind: skip them and start over from now.
+                # Ids skipped inside the lookback window are re-read next time, which is harmless
+                self.version = current_version(conn)
+                rows = None
+            if time.monotonic() > self._next_prune:
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+                self._prune(conn)
+        self.last_read = time.monotonic()
+        if rows is None:
+            self._dispatch(None)
+            return
+
+        product_ids = set()
+        for change_id, product_id in rows:
+            if change_id in self._seen_ids:
+                continue
+            self._seen_ids.add(change_id)
+            self._seen.append(change_id)
+            product_ids.add(product_id)
+            self.version = max(self.version, change_id)
+        while self._seen and self._seen[0] <= self.version - LOOKBACK:
+            self._seen_ids.discard(self._seen.popleft())
+        if product_ids:
+            self._dispatch(product_ids)
+
+    def _dispatch(self, product_ids):
+        for callback in self.subscribers:
+            try:
+                callback(product_ids, self.version)
+            except Exception as e:
+                print(f"Catalog change subscriber failed: {e}")
+
+    def _prune(self, conn):
+        # Any worker may prune; the newest row always stays so the version never goes back
+        cutoff = datetime.utcnow() - CATALOG_CHANGES_RETENTION
+        conn.execute(delete(changes).where(changes.c.changed_at < cutoff, changes.c.id < self.version))
+        conn.commit()
+
+    def start(self):
+        if self._thread is None:
+            target = self._listen if self.bind.dialect.name == "postgresql" else self._poll_loop
+            self._thread = threading.Thread(target=target, name="catalog-change-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _safe_poll(self):
+        try:
+            self.poll()
+        except Exception as e:
+            print(f"Catalog change feed poll failed: {e}")
+
+    def _poll_loop(self):
+        self._safe_poll()
+        while not self._stop.wait(self.interval):
+            self._safe_poll()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = self.bind.raw_connection()
+                raw.driver_connection.autocommit = True
+                cursor = raw.driver_connection.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                self._safe_poll()  # Changes committed before LISTEN took effect
+                while not self._stop.is_set():
+                    # Wake on NOTIFY, or after the backstop interval
+                    select_module.select([raw.driver_connection], [], [], self.interval)
+                    raw.driver_connection.poll()
+                    raw.driver_connection.notifies.clear()
+                    self._safe_poll()
+            except Exception as e:
+                print(f"Catalog change feed LISTEN failed, retrying: {e}")
+                self._stop.wait(self.interval)
+            finally:
+                if raw is not None:
+                    raw.invalidate()  # Don't return a LISTENing connection to the pool
+
+
+class ProductCache:
+    """LRU of serialized products, invalidated per product by the change feed.
+
+    Only used while the feed is current, so an entry is never served more than
+    one feed interval after the product changed.
+    """
+
+    def __init__(self, feed, max_size=PRODUCT_CACHE_SIZE):
+        self.feed = feed
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+        feed.subscribe(self.invalidate)
+        _local_caches.add(self)
+
+    def get(self, product_id):
+        if not self.feed.is_current():
+            return None
+        with self.lock:
+            value = self.entries.get(product_id)
+            if value is not None:
+                self.entries.move_to_end(product_id)
+            return value
+
+    def put(self, product_id, value, generation):
+        """Store a value read from the DB, unless something was invalidated since `generation`."""
+        with self.lock:
+            # A read that started before an invalidation may have seen the old row
+            if generation != self.generation or not self.feed.is_current():
+                return
+            self.entries[product_id] = value
+            self.entries.move_to_end(product_id)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, product_ids, version=None):
+        """Drop `product_ids`, or every entry if product_ids is None."""
+        with self.lock:
+            self.generation += 1
+            if product_ids is None:
+                self.entries.clear()
+                return
+            for product_id in product_ids:
+                self.entries.pop(product_id, None)
@@ -0,0 +1,203 @@
+"""Query-plan regression check.
+
+Drives every API endpoint against a throwaway database, captures each SQL
+statement the endpoint issues and runs it through EXPLAIN. Fails (exit code 1)
+when a plan does a full table scan or a temp B-tree / Sort step that isn't
+explicitly expected.
+
+    python check_query_plans.py                                # in-memory SQLite
+    PLAN_CHECK_DATABASE_URL=postgresql://... python check_query_plans.py
+
+On Postgres the planner is run with enable_seqscan/enable_sort off, so a
+"Seq Scan" or "Sort" node in the plan means no usable index exists at all.
+Point PLAN_CHECK_DATABASE_URL at a scratch database: tables are created and
+rows are written.
+"""
+import json
+import os
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import create_db_engine
+import models
+import main
+from admin_auth import require_admin
+from live_updates import Broadcaster
+
+PLAN_CHECK_DATABASE_URL = os.getenv("PLAN_CHECK_DATABASE_URL", "sqlite://")
+
+# (name, method, path, json body, tables allowed to be fully scanned)
+# Listing/search endpoints that return the whole catalog can't avoid a scan.
+SCENARIOS = [
+    ("products_all", "GET", "/api/products", None, {"products"}),
+    ("products_newest", "GET", "/api/products?sort_by=newest", None, {"products"}),
+    ("products_category", "GET", "/api/products?category=Roasted", None, set()),
+    ("products_category_price_asc", "GET", "/api/products?category=Roasted&min_price=0&max_price=25&sort_by=price_asc", None, set()),
+    ("products_category_price_desc", "GET", "/api/products?category=Raw&min_price=25&max_price=40&sort_by=price_desc", None, set()),
+    ("products_price_range", "GET", "/api/products?min_price=40&max_price=1000&sort_by=price_asc", None, set()),
+    ("product_detail", "GET", "/api/products/1", None, set()),
+    # Substring ILIKE can't use a b-tree index
+    ("search", "GET", "/api/search?q=almond", None, {"products"}),
+    ("cart_add", "POST", "/api/cart", {"product_id": 1, "quantity": 1}, set()),
+    ("cart_add_existing", "POST", "/api/cart", {"product_id": 1, "quantity": 1}, set()),
+    ("cart_get", "GET", "/api/cart", None, set()),
+    ("session_bootstrap", "GET", "/api/session/bootstrap", None, set()),
+    ("wishlist_add", "POST", "/api/wishlist", {"product_id": 2}, set()),
+    ("wishlist_get", "GET", "/api/wishlist", None, set()),
+    ("wishlist_remove", "DELETE", "/api/wishlist/2", None, set()),
+    ("subscribe", "POST", "/api/subscribe", {"email": "plans@example.com"}, set()),
+    ("checkout", "POST", "/api/checkout", {"customer_name": "Plan Check", "email": "plans@example.com", "address": "1 Index Way", "city": "Btree"}, set()),
+    # Admin endpoints run after checkout so there is an order to read
+    ("export_orders", "GET", "/api/admin/export/orders", None, {"orders"}),
+    ("export_orders_created_range", "GET", "/api/admin/export/orders?created_from=2000-01-01T00:00:00&created_to=2100-01-01T00:00:00", None, set()),
+    ("export_orders_created_resume", "GET", "/api/admin/export/orders?created_from=2000-01-01T00:00:00&after_created_at=2000-01-01T00:00:00&after_id=0&limit=100", None, set()),
+    ("export_orders_after_id", "GET", "/api/admin/export/orders?after_id=0&limit=100", None, set()),
+    ("export_products", "GET", "/api/admin/export/products?after_id=0", None, set()),
+    ("admin_order_lookup", "GET", "/api/admin/orders/1", None, set()),
+]
+
+# Queries issued outside a request: (name, callable(bind), tables allowed to be fully scanned)
+BACKGROUND_SCENARIOS = [
+    ("stream_snapshot", lambda bind: Broadcaster(bind).read_products([1, 2, 3]), set()),
+]
+
+CATEGORIES = ["Roasted", "Raw", "Confection", "Reserve"]
+
+
+def make_fixture_engine():
+    if PLAN_CHECK_DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+        # Single shared connection so every session sees the same in-memory DB
+        fixture_engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+    else:
+        fixture_engine = create_db_engine(PLAN_CHECK_DATABASE_URL)
+
+    models.Base.metadata.drop_all(bind=fixture_engine)
+    models.Base.metadata.create_all(bind=fixture_engine)
+    rows = [
+        {
+            "id": i,
+            "name": f"Plan Check Almonds {i}",
+            "slug": f"plan-check-almonds-{i}",
+            "description": "Fixture product",
+            "price": 10.0 + i * 3,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "stock_quantity": 100,
+            "image_url": "https://images.unsplash.com/photo-1506103859296-1c00aa16d99f",
+            "weight": "500g",
+            "grade": "Premium",
+            "origin": "Global",
+        }
+        for i in range(1, 25)
+    ]
+    with fixture_engine.begin() as conn:
+        conn.execute(insert(models.Product), rows)
+    return fixture_engine
+
+
+def explain(conn, statement, parameters):
+    """Return (plan lines, problems) for one captured statement."""
+    problems = []
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        lines = [row[-1] for row in rows]
+        for line in lines:
+            if line.startswith("SCAN ") and " USING " not in line:
+                problems.append(("scan", line.split()[1]))
+            if "USE TEMP B-TREE" in line:
+                problems.append(("sort", line))
+        return lines, problems
+
+    # Postgres: make the planner avoid scans/sorts whenever an index allows it
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    conn.exec_driver_sql("SET LOCAL enable_sort = off")
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines = []
+
+    def walk(node, depth=0):
+        lines.append("  " * depth + node["Node Type"] + (f" on {node['Relation Name']}" if "Relation Name" in node else ""))
+        if node["Node Type"] == "Seq Scan":
+            problems.append(("scan", node["Relation Name"]))
+        if node["Node Type"] in ("Sort", "Incremental Sort"):
+            problems.append(("sort", node["Node Type"]))
+        for child in node.get("Plans", []):
+            walk(child, depth + 1)
+
+    walk(plan[0]["Plan"])
+    return lines, problems
+
+
+def check_query_plans(verbose=False):
+    fixture_engine = make_fixture_engine()
+    FixtureSession = sessionmaker(autocommit=False, autoflush=False, bind=fixture_engine)
+
+    def get_fixture_db():
+        db = FixtureSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    captured = []
+
+    @event.listens_for(fixture_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            captured.append((statement, parameters))
+
+    main.app.dependency_overrides[main.get_db] = get_fixture_db
+    main.app.dependency_overrides[require_admin] = lambda: None
+    client = TestClient(main.app)
+    scenarios = [(name, (method, path, body), allowed) for name, method, path, body, allowed in SCENARIOS]
+    scenarios += BACKGROUND_SCENARIOS
+    failures = 0
+    try:
+        for name, action, allowed_scans in scenarios:
+            captured.clear()
+            if callable(action):
+                action(fixture_engine)
+            else:
+                method, path, body = action
+                response = client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    print(f"[ERROR] {name}: {method} {path} -> {response.status_code} {response.text}")
+                    failures += 1
+                    continue
+
+            statements = list(captured)
+            scenario_failures = 0
+            for statement, parameters in statements:
+                with fixture_engine.connect() as conn:
+                    with conn.begin():
+                        lines, problems = explain(conn, statement, parameters)
+                regressions = [
+                    p for p in problems
+                    if not (p[0] == "scan" and p[1] in allowed_scans)
+                ]
+                status = "FAIL" if regressions else "ok"
+                if regressions or verbose:
+                    print(f"[{status}] {name}: {' '.join(statement.split())[:120]}")
+                    for line in lines:
+                        print(f"        {line}")
+                scenario_failures += bool(regressions)
+            failures += scenario_failures
+            if not verbose and not scenario_failures:
+                print(f"[ok] {name}: {len(statements)} statement(s) checked")
+    finally:
+        main.app.dependency_overrides.pop(main.get_db, None)
+        main.app.dependency_overrides.pop(require_admin, None)
+        fixture_engine.dispose()
+
+    print(f"\n{fixture_engine.dialect.name}: {failures} plan regression(s)")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_query_plans(verbose="-v" in sys.argv) else 0)
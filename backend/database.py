@@ -1,6 +1,6 @@
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
+import threading
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -8,27 +8,100 @@ from pathlib import Path
 
 # Load .env.local from the project root (parent of backend/)
 # This ensures it works regardless of where the script is run from
+# NUTMUNCH_ENV_FILE points at another file (or a missing one to skip loading, e.g. for fixtures)
 BASE_DIR = Path(__file__).resolve().parent.parent
-env_path = BASE_DIR / ".env.local"
-load_dotenv(dotenv_path=env_path, override=True)
+env_path = Path(os.getenv("NUTMUNCH_ENV_FILE", BASE_DIR / ".env.local"))
+if env_path.is_file():
+    # Deployed environments set real env vars and have no file, so skip importing dotenv there
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path, override=True)
 
 # Get the Database URL from env, defaulting to local sqlite
 # If Env loading works, this should be the Neon URL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
-print(f"DEBUG: Loaded DATABASE_URL starting with: {SQLALCHEMY_DATABASE_URL[:15]}...")
 
-# Fix for SQLAlchemy 1.4+ which deprecated postgres://
-if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# SQLite performance profile, applied to every new DBAPI connection.
+# WAL lets readers and the (single) writer run concurrently, busy_timeout makes
+# concurrent writers queue instead of failing with "database is locked".
+# Values can be tuned per deployment through the environment.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),  # negative = KiB
+    "temp_store": "MEMORY",
+    "journal_size_limit": 64 * 1024 * 1024,  # Truncate the WAL back to this after checkpoints
+}
 
-# Handle arguments: check_same_thread is ONLY for SQLite
-connect_args = {}
-if "sqlite" in SQLALCHEMY_DATABASE_URL:
-    connect_args = {"check_same_thread": False}
+# How often (seconds) each worker runs PRAGMA optimize + a WAL checkpoint. 0 disables.
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "300"))
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
-)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def create_db_engine(url):
+    # Fix for SQLAlchemy 1.4+ which deprecated postgres://
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+
+    # Handle arguments: check_same_thread is ONLY for SQLite
+    connect_args = {}
+    if url.startswith("sqlite"):
+        connect_args = {
+            "check_same_thread": False,
+            # pysqlite's own busy handler, kept in line with PRAGMA busy_timeout
+            "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        }
+
+    new_engine = create_engine(url, connect_args=connect_args)
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def sqlite_maintenance(target_engine=None):
+    """Refresh planner statistics and checkpoint the WAL. No-op on other databases.
+
+    Returns the (busy, wal_pages, checkpointed_pages) row of the checkpoint.
+    """
+    target_engine = target_engine or engine
+    if target_engine.dialect.name != "sqlite":
+        return None
+    with target_engine.connect() as conn:
+        conn.execute(text("PRAGMA optimize"))
+        # PASSIVE never blocks readers or writers; it copies whatever it can
+        result = conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).fetchone()
+        conn.commit()
+    return tuple(result) if result else None
+
+
+def start_sqlite_maintenance(interval=None):
+    """Run sqlite_maintenance() every `interval` seconds on a daemon thread."""
+    interval = SQLITE_MAINTENANCE_INTERVAL if interval is None else interval
+    if engine.dialect.name != "sqlite" or interval <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                sqlite_maintenance()
+            except Exception as e:
+                print(f"SQLite maintenance failed: {e}")
+
+    thread = threading.Thread(target=loop, name="sqlite-maintenance", daemon=True)
+    thread.start()
+    return stop
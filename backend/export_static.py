@@ -0,0 +1,234 @@
+"""Export the catalog as static, precompressed JSON for CDN / edge serving.
+
+Renders every view the storefront asks /api/products for (each category x price
+range x sort), the category list, every product detail and a search-suggest
+index. Each file is content-hashed (so it can be cached as immutable) and written
+next to .gz and .br copies for servers that serve precompressed files
+(gzip_static / brotli_static). manifest.json maps view keys to files; it is the
+only file that changes in place. It also records the catalog version
+(catalog_changes.py) the export was read at, which the storefront compares with
+the version /api/session/bootstrap reports.
+
+Exports are incremental: a view whose content hash matches the previous manifest
+is left alone, so only views whose products changed are rewritten and
+recompressed. Files no longer referenced are removed.
+
+    python export_static.py                              # -> ../public/catalog
+    python export_static.py --out-dir ../dist/catalog --database-url postgresql://...
+
+View keys match the API paths (relative to /api) with query parameters in the
+order lib/api.ts sends them, e.g. "products?category=Raw&sort_by=price_asc".
+
+Brotli output needs the optional `brotli` package; without it only gzip is written.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from sqlalchemy import select
+
+from catalog_changes import current_version
+from database import create_db_engine, SQLALCHEMY_DATABASE_URL
+import models
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public", "catalog")
+MANIFEST_VERSION = 1
+
+# Same fields, in the same order, as main.Product (the /api/products response model)
+PRODUCT_FIELDS = [
+    "name", "slug", "description", "price", "category", "stock_quantity", "image_url",
+    "weight", "grade", "origin", "nutritional_info", "sustainability_info", "id",
+]
+SUGGEST_FIELDS = ["id", "name", "slug", "category", "price", "image_url"]
+
+# Keep in sync with the filters on pages/ShopPage.tsx
+SORTS = [None, "price_asc", "price_desc", "newest"]
+PRICE_RANGES = [None, (0, 25), (25, 40), (40, 1000)]
+
+
+def _number(value):
+    """Format like JavaScript's Number.toString(), which builds the frontend's query strings."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def view_key(category=None, sort_by=None, price_range=None):
+    params = []
+    if category:
+        params.append(("category", category))
+    if sort_by:
+        params.append(("sort_by", sort_by))
+    if price_range:
+        params.append(("min_price", _number(price_range[0])))
+        params.append(("max_price", _number(price_range[1])))
+    # urlencode quotes like URLSearchParams, which builds the frontend's keys
+    return "products" + ("?" + urlencode(params) if params else "")
+
+
+def _view_path(category, sort_by, price_range):
+    name = sort_by or "default"
+    if price_range:
+        name += f"-{_number(price_range[0])}-{_number(price_range[1])}"
+    folder = re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-") if category else "all"
+    return f"products/{folder}/{name}"
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def load_products(engine):
+    """Return products as API-shaped dicts, in id order."""
+    table = models.Product.__table__
+    columns = [table.c[name] for name in PRODUCT_FIELDS]
+    products = []
+    with engine.connect() as conn:
+        for row in conn.execute(select(*columns).order_by(table.c.id)):
+            product = dict(zip(PRODUCT_FIELDS, row))
+            product["price"] = float(product["price"]) if product["price"] is not None else None
+            products.append(product)
+    return products
+
+
+def render_views(products):
+    """Yield (key, path, body bytes) for every static view."""
+    # Each product is serialized once and the fragments reused by every list it appears in
+    encoded = {p["id"]: _dumps(p) for p in products}
+
+    def listing(items):
+        return b"[" + b",".join(encoded[p["id"]] for p in items) + b"]"
+
+    categories = sorted({p["category"] for p in products if p["category"]})
+    for category in [None] + categories:
+        in_category = [p for p in products if not category or p["category"] == category]
+        for price_range in PRICE_RANGES:
+            if price_range:
+                low, high = price_range
+                matching = [p for p in in_category if p["price"] is not None and low <= p["price"] <= high]
+            else:
+                matching = in_category
+            for sort_by in SORTS:
+                if sort_by == "price_asc":
+                    ordered = sorted(matching, key=lambda p: p["price"])
+                elif sort_by == "price_desc":
+                    ordered = sorted(matching, key=lambda p: p["price"], reverse=True)
+                elif sort_by == "newest":
+                    ordered = matching[::-1]  # ID proxy for newest, as in the API
+                else:
+                    ordered = matching
+                yield view_key(category, sort_by, price_range), _view_path(category, sort_by, price_range), listing(ordered)
+
+    counts = {c: sum(1 for p in products if p["category"] == c) for c in categories}
+    yield "categories", "categories", _dumps([{"name": c, "count": counts[c]} for c in categories])
+    yield "search-index", "search-index", _dumps([[p[f] for f in SUGGEST_FIELDS] for p in products])
+    for p in products:
+        yield f"products/{p['id']}", f"product/{p['id']}", encoded[p["id"]]
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("views", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def _files(entry):
+    return [entry["file"]] + [entry["file"] + suffix for suffix in entry.get("encodings", {}).values()]
+
+
+def export(engine, out_dir=DEFAULT_OUT_DIR, force=False):
+    """Write the static catalog to `out_dir`. Returns a summary dict."""
+    started = time.perf_counter()
+    previous = _load_manifest(out_dir)
+    with engine.connect() as conn:
+        # Read before the products, so the export holds at least every change up to this version
+        catalog_version = current_version(conn)
+    products = load_products(engine)
+
+    views = {}
+    written = unchanged = 0
+    for key, path, body in render_views(products):
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        old = previous.get(key)
+        if not force and old and old["hash"] == digest and all(os.path.exists(os.path.join(out_dir, f)) for f in _files(old)):
+            views[key] = old
+            unchanged += 1
+            continue
+
+        filename = f"{path}.{digest}.json"
+        entry = {"file": filename, "hash": digest, "bytes": len(body), "encodings": {"gzip": ".gz"}}
+        _write(os.path.join(out_dir, filename), body)
+        # mtime=0 keeps the .gz byte-identical across exports of the same content
+        _write(os.path.join(out_dir, filename + ".gz"), gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(os.path.join(out_dir, filename + ".br"), brotli.compress(body, quality=11))
+            entry["encodings"]["br"] = ".br"
+        views[key] = entry
+        written += 1
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "catalog_version": catalog_version,
+        "products": len(products),
+        "views": views,
+    }
+    _write(os.path.join(out_dir, "manifest.json"), json.dumps(manifest, indent=1).encode())
+
+    # Drop files only the previous export referenced (changed or deleted views)
+    keep = {f for entry in views.values() for f in _files(entry)}
+    removed = 0
+    for entry in previous.values():
+        for f in _files(entry):
+            path = os.path.join(out_dir, f)
+            if f not in keep and os.path.exists(path):
+                os.remove(path)
+                removed += 1
+
+    return {
+        "views": len(views),
+        "written": written,
+        "unchanged": unchanged,
+        "files_removed": removed,
+        "brotli": brotli is not None,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR)
+    parser.add_argument("--force", action="store_true", help="rewrite every view, ignoring the previous manifest")
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli not installed; writing gzip copies only")
+    summary = export(create_db_engine(args.database_url), args.out_dir, args.force)
+    print(f"Exported {summary['views']} views to {args.out_dir}: {summary['written']} written, "
+          f"{summary['unchanged']} unchanged, {summary['files_removed']} stale files removed "
+          f"in {summary['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Streaming NDJSON / CSV exports of orders and the catalog, for reconciliation.
+
+Rows are read through a server-side cursor (stream_results + yield_per; SQLite's
+cursor is incremental already) EXPORT_CHUNK_SIZE at a time, as plain Core rows,
+and each chunk is written to the response as soon as it is read. Memory stays
+flat whatever the size of the export.
+
+Output is ordered by id, or by (created_at, id) with a date filter. The two
+orders can disagree: created_at is stamped before the INSERT assigns the id, so
+concurrent checkouts can commit out of created_at order. To resume an
+interrupted download, pass the last order fully received: ?after_id= for an id
+export, ?after_created_at=&after_id= (compared as a pair) for a date export.
+Date filters are half-open: created_from <= created_at < created_to.
+
+Orders of months moved to the cold archive are no longer in these tables; the
+admin order export goes through order_archive.export_orders, which reads them
+from the archive first.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+
+import models
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+ORDER_FIELDS = ["id", "customer_name", "email", "address", "city", "total_amount", "status", "created_at"]
+ITEM_FIELDS = ["product_id", "quantity", "price_at_purchase"]
+PRODUCT_FIELDS = [column.name for column in models.Product.__table__.columns]
+
+
+def _stream_chunks(bind, statement):
+    """Yield lists of rows, EXPORT_CHUNK_SIZE at a time, from a server-side cursor."""
+    with bind.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE).execute(statement)
+        for chunk in result.partitions():
+            yield chunk
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson(records):
+    return "".join(json.dumps(record, separators=(",", ":"), default=_value) + "\n" for record in records)
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_value(v) for v in row] for row in rows)
+    return buffer.getvalue()
+
+
+def orders_statement(created_from=None, created_to=None, after_id=None, limit=None, after_created_at=None):
+    """Orders joined to their items, one row per item (orders without items get one row).
+
+    Rows come in the order of the index that selects them, so the database can
+    stream them without sorting: by id, or by (created_at, id) when a created_at
+    range is given. The resume cursor follows the same key: after_id alone by id,
+    (after_created_at, after_id) by created_at.
+    """
+    orders = models.Order.__table__
+    items = models.OrderItem.__table__
+    conditions = []
+    if after_created_at is not None:
+        conditions.append(tuple_(orders.c.created_at, orders.c.id) > tuple_(after_created_at, after_id))
+    elif after_id is not None:
+        conditions.append(orders.c.id > after_id)
+    if created_from is not None:
+        conditions.append(orders.c.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(orders.c.created_at < created_to)
+    by_created = created_from is not None or created_to is not None
+    order_key = [orders.c.created_at, orders.c.id] if by_created else [orders.c.id]
+
+    if limit is not None:
+        # Limit whole orders, not item rows. The ids are looked up first, so the outer
+        # query still walks an index in order
+        page = select(orders.c.id).where(*conditions).order_by(*order_key).limit(limit)
+        if by_created:
+            # Walk (created_at, id) only up to the limit-th order's created_at, and keep
+            # the planner from driving the outer query off the primary key (`id + 0`)
+            nth = select(orders.c.created_at).where(*conditions).order_by(*order_key).offset(limit - 1).limit(1)
+            conditions.append(orders.c.created_at <= func.coalesce(nth.scalar_subquery(), created_to or datetime.max))
+            conditions.append((orders.c.id + 0).in_(page))
+        else:
+            conditions.append(orders.c.id.in_(page))
+    return (
+        select(*[orders.c[f] for f in ORDER_FIELDS], *[items.c[f] for f in ITEM_FIELDS])
+        .select_from(orders.outerjoin(items, items.c.order_id == orders.c.id))
+        .where(*conditions)
+        .order_by(*order_key, items.c.id)
+    )
+
+
+def export_orders(bind, fmt, created_from=None, created_to=None, after_id=None, limit=None, after_created_at=None):
+    """Yield NDJSON (one order per line, items nested) or CSV (one line per order item)."""
+    statement = orders_statement(created_from, created_to, after_id, limit, after_created_at)
+    return format_orders(_stream_chunks(bind, statement), fmt)
+
+
+def format_orders(chunks, fmt):
+    """Format chunks of orders_statement() rows, grouped by order, as NDJSON or CSV."""
+    width = len(ORDER_FIELDS)
+    if fmt == "csv":
+        yield _csv([["order_id"] + ORDER_FIELDS[1:] + ITEM_FIELDS])
+        for chunk in chunks:
+            yield _csv(chunk)
+        return
+
+    # Rows arrive grouped by order id; an order may straddle two chunks, so the
+    # one being assembled is only emitted once its last item has been read
+    current, current_items = None, []
+    for chunk in chunks:
+        records = []
+        for row in chunk:
+            if current is not None and row[0] != current["id"]:
+                records.append(dict(current, items=current_items))
+                current = None
+            if current is None:
+                current, current_items = dict(zip(ORDER_FIELDS, row[:width])), []
+            if row[width] is not None:
+                current_items.append(dict(zip(ITEM_FIELDS, row[width:])))
+        if records:
+            yield _ndjson(records)
+    if current is not None:
+        yield _ndjson([dict(current, items=current_items)])
+
+
+def export_products(bind, fmt, after_id=None, limit=None):
+    table = models.Product.__table__
+    statement = select(*[table.c[f] for f in PRODUCT_FIELDS]).order_by(table.c.id)
+    if after_id is not None:
+        statement = statement.where(table.c.id > after_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    if fmt == "csv":
+        yield _csv([PRODUCT_FIELDS])
+    for chunk in _stream_chunks(bind, statement):
+        yield _csv(chunk) if fmt == "csv" else _ndjson(dict(zip(PRODUCT_FIELDS, row)) for row in chunk)
+
+
+def streaming_response(chunks, fmt, name):
+    # A sync generator: Starlette iterates it in the threadpool, one chunk at a time
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{name}.{fmt}"',
+        "Cache-Control": "no-store",
+    })
@@ -0,0 +1,287 @@
+"""Streaming bulk catalog importer.
+
+Reads a supplier catalog (CSV with a header row, or JSON Lines) one record at a
+time, validates it and upserts products by slug in large chunks:
+
+- SQLite: multi-row INSERT ... ON CONFLICT(slug) DO UPDATE via executemany
+- Postgres: COPY into a temp staging table, then one INSERT ... SELECT ... ON CONFLICT merge
+
+Rows whose values are unchanged are skipped by the upsert, so re-importing the
+same catalog writes nothing and logs no catalog changes.
+
+Invalid records are written to a rejects file instead of failing the run. After
+every committed chunk a checkpoint is saved, so an interrupted import picks up
+where it stopped with --resume.
+
+    python import_catalog.py catalog.csv
+    python import_catalog.py catalog.jsonl --chunk-size 20000 --resume
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import re
+import sys
+import time
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import engine
+from catalog_changes import record_changes
+from update_products import derive_product_info
+import models
+
+CHUNK_SIZE = 5000
+SLUG_RE = re.compile(r"^[a-z0-9]+(?:-[a-z0-9]+)*$")
+
+REQUIRED_FIELDS = ("name", "slug", "price", "category")
+# Optional text fields default to "" so the API's response models stay valid
+TEXT_FIELDS = ("description", "image_url", "weight", "grade", "origin")
+COLUMNS = (
+    "name", "slug", "description", "price", "category", "stock_quantity",
+    "image_url", "weight", "grade", "origin", "nutritional_info", "sustainability_info",
+)
+
+
+class RejectedRecord(ValueError):
+    pass
+
+
+def read_records(path, fmt):
+    """Yield raw records as dicts, one at a time."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield RejectedRecord(f"line {line_no}: invalid JSON ({e.msg})")
+
+
+def validate(record):
+    """Return a clean row dict for the products table, or raise RejectedRecord."""
+    if isinstance(record, RejectedRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise RejectedRecord("record is not an object")
+
+    missing = [f for f in REQUIRED_FIELDS if record.get(f) in (None, "")]
+    if missing:
+        raise RejectedRecord(f"missing {', '.join(missing)}")
+
+    slug = str(record["slug"]).strip()
+    if not SLUG_RE.match(slug):
+        raise RejectedRecord(f"invalid slug {slug!r}")
+
+    try:
+        price = float(record["price"])
+    except (TypeError, ValueError):
+        raise RejectedRecord(f"invalid price {record['price']!r}")
+    if not math.isfinite(price) or price < 0:
+        raise RejectedRecord(f"invalid price {record['price']!r}")
+
+    stock = record.get("stock_quantity")
+    if stock in (None, ""):
+        stock = 100
+    else:
+        try:
+            stock = int(stock)
+        except (TypeError, ValueError):
+            raise RejectedRecord(f"invalid stock_quantity {stock!r}")
+        if stock < 0:
+            raise RejectedRecord(f"invalid stock_quantity {stock!r}")
+
+    row = {
+        "name": str(record["name"]).strip(),
+        "slug": slug,
+        "price": price,
+        "category": str(record["category"]).strip(),
+        "stock_quantity": stock,
+    }
+    for field in TEXT_FIELDS:
+        value = record.get(field)
+        row[field] = "" if value is None else str(value)
+
+    nutrition, sustainability = derive_product_info(row["name"], row["origin"])
+    nutritional_info = record.get("nutritional_info")
+    if nutritional_info in (None, ""):
+        nutritional_info = nutrition
+    elif isinstance(nutritional_info, (dict, list)):
+        nutritional_info = json.dumps(nutritional_info)
+    else:
+        try:
+            json.loads(nutritional_info)
+        except (TypeError, ValueError):
+            raise RejectedRecord("nutritional_info is not valid JSON")
+    row["nutritional_info"] = nutritional_info
+    row["sustainability_info"] = record.get("sustainability_info") or sustainability
+    return row
+
+
+def upsert_chunk(conn, rows):
+    """Upsert one chunk of validated rows by slug inside the caller's transaction."""
+    products = models.Product.__table__
+    update_cols = [c for c in COLUMNS if c != "slug"]
+
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(
+            "CREATE TEMP TABLE IF NOT EXISTS products_staging ON COMMIT DELETE ROWS AS "
+            f"SELECT {', '.join(COLUMNS)} FROM products WITH NO DATA"
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[c] for c in COLUMNS])
+        buffer.seek(0)
+        text_cols = ", ".join(c for c in COLUMNS if c not in ("price", "stock_quantity"))
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY products_staging ({', '.join(COLUMNS)}) FROM STDIN "
+                f"WITH (FORMAT csv, FORCE_NOT_NULL ({text_cols}))",
+                buffer,
+            )
+        finally:
+            cursor.close()
+        changed_ids = conn.exec_driver_sql(
+            f"INSERT INTO products ({', '.join(COLUMNS)}) "
+            f"SELECT {', '.join(COLUMNS)} FROM products_staging "
+            "ON CONFLICT (slug) DO UPDATE SET "
+            + ", ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
+            # Unchanged rows are left alone, so RETURNING only has the ids that actually changed
+            + f" WHERE ({', '.join(f'products.{c}' for c in update_cols)}) "
+            + f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in update_cols)})"
+            + " RETURNING id"
+        ).scalars().all()
+        record_changes(conn, changed_ids)
+        return
+
+    if conn.dialect.name == "sqlite":
+        stmt = sqlite_insert(products)
+    else:
+        raise RuntimeError(f"Bulk upsert is not supported on {conn.dialect.name}")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[products.c.slug],
+        set_={c: stmt.excluded[c] for c in update_cols},
+        # Same as on Postgres: skip unchanged rows (IS NOT, SQLite's null-safe comparison)
+        where=or_(*[products.c[c].is_distinct_from(stmt.excluded[c]) for c in update_cols]),
+    ).returning(products.c.id)
+    # SQLAlchemy batches the rows into multi-row INSERTs, so RETURNING works for the whole chunk
+    record_changes(conn, conn.execute(stmt, rows).scalars().all())
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)  # atomic, so a crash never leaves a half-written checkpoint
+
+
+def import_catalog(path, fmt=None, chunk_size=CHUNK_SIZE, resume=False, rejects_path=None, checkpoint_path=None):
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    checkpoint_path = checkpoint_path or f"{path}.checkpoint.json"
+    rejects_path = rejects_path or f"{path}.rejects.jsonl"
+
+    state = {"source": os.path.abspath(path), "records": 0, "upserted": 0, "rejected": 0}
+    previous = load_checkpoint(checkpoint_path) if resume else None
+    if previous and previous.get("source") == state["source"]:
+        state = previous
+        print(f"Resuming after record {state['records']} ({state['upserted']} upserted, {state['rejected']} rejected so far)")
+        if os.path.exists(rejects_path) and "rejects_bytes" in state:
+            # Drop rejects written after the checkpoint: their chunk is replayed and writes them again
+            with open(rejects_path, "r+b") as rejects:
+                rejects.truncate(state["rejects_bytes"])
+    elif os.path.exists(rejects_path):
+        os.remove(rejects_path)
+    skip = state["records"]
+
+    started = time.perf_counter()
+    processed_this_run = 0
+    chunk = {}
+    pending_rejects = []
+    chunk_records = 0
+
+    def commit_chunk():
+        nonlocal chunk_records
+        if chunk:
+            with engine.begin() as conn:
+                upsert_chunk(conn, list(chunk.values()))
+        if pending_rejects:
+            with open(rejects_path, "a", encoding="utf-8") as rejects:
+                for reject in pending_rejects:
+                    rejects.write(json.dumps(reject) + "\n")
+                rejects.flush()
+                os.fsync(rejects.fileno())
+        # Checkpoint only after the chunk is durable. It records how much of the
+        # rejects file belongs to checkpointed chunks, so a resume can cut off the rest
+        state["rejects_bytes"] = os.path.getsize(rejects_path) if os.path.exists(rejects_path) else 0
+        state["records"] += chunk_records
+        state["upserted"] += len(chunk)
+        state["rejected"] += len(pending_rejects)
+        save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.perf_counter() - started
+        rate = processed_this_run / elapsed if elapsed else 0
+        print(f"  {state['records']:>10} records | {state['upserted']:>10} upserted | {state['rejected']:>7} rejected | {rate:,.0f} rec/s")
+        chunk.clear()
+        pending_rejects.clear()
+        chunk_records = 0
+
+    for record_no, record in enumerate(read_records(path, fmt), start=1):
+        if record_no <= skip:
+            continue
+        chunk_records += 1
+        processed_this_run += 1
+        try:
+            row = validate(record)
+            # Later duplicates of a slug within a chunk win; Postgres refuses to merge the same key twice
+            chunk[row["slug"]] = row
+        except RejectedRecord as e:
+            pending_rejects.append({"record": record_no, "error": str(e), "data": record if isinstance(record, dict) else None})
+        if chunk_records >= chunk_size:
+            commit_chunk()
+    if chunk_records:
+        commit_chunk()
+
+    elapsed = time.perf_counter() - started
+    rate = processed_this_run / elapsed if elapsed else 0
+    print(f"Imported {path}: {state['upserted']} upserted, {state['rejected']} rejected "
+          f"in {elapsed:.1f}s ({rate:,.0f} records/s this run)")
+    if state["rejected"]:
+        print(f"Rejected records written to {rejects_path}")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # Finished; a new run starts from scratch
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV (with header) or JSON Lines file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--rejects", help="where to write rejected records (default: <path>.rejects.jsonl)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <path>.checkpoint.json)")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    import_catalog(args.path, args.format, args.chunk_size, args.resume, args.rejects, args.checkpoint)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""Per-request performance instrumentation.
+
+- PerfMiddleware collects, per request: DB time, statement count, ORM rows loaded,
+  threadpool queue wait and serialization time, and sends them back as a
+  Server-Timing header.
+- TimedRoute is the APIRoute class that measures queue wait / serialization.
+- METRICS is a tiny Prometheus-text registry (per process) holding per-route
+  latency histograms; render it from a /metrics endpoint.
+- With PERF_DEBUG=1 every request is checked for N+1 query patterns.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from fastapi import Depends
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+PERF_DEBUG = os.getenv("PERF_DEBUG", "0") == "1"
+# Same SQL executed more often than this within one request looks like N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("PERF_N_PLUS_ONE_THRESHOLD", "3"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = (
+        "started", "db_time", "statements", "rows", "queue_wait",
+        "dispatched", "handler_end", "thread_ids", "threads_lock", "statement_counts",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.queue_wait = 0.0
+        self.dispatched = None  # when the handler was handed to the threadpool
+        self.handler_end = None
+        self.thread_ids = set()  # worker threads that ran this request's handler
+        self.threads_lock = threading.Lock()
+        self.statement_counts = defaultdict(int) if PERF_DEBUG else None
+
+    def add_thread(self, thread_id):
+        with self.threads_lock:
+            self.thread_ids.add(thread_id)
+
+    def threads(self):
+        """Snapshot of thread_ids, safe to iterate while handler threads register."""
+        with self.threads_lock:
+            return set(self.thread_ids)
+
+    def server_timing(self, app_time):
+        serialization = time.perf_counter() - self.handler_end if self.handler_end else 0.0
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.statements} statements, {self.rows} rows"',
+            f"queue;dur={self.queue_wait * 1000:.2f}",
+            f"ser;dur={serialization * 1000:.2f}",
+            f"app;dur={app_time * 1000:.2f}",
+        ])
+
+
+REQUEST_STATS: ContextVar = ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return REQUEST_STATS.get()
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format.
+
+    Updated from the event loop and from sync handler threads (e.g. the rate
+    limiter), so every update takes a lock; each one is a few dict operations.
+    """
+
+    def __init__(self):
+        self.meta = {}
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text, buckets=None):
+        self.meta[name] = (metric_type, help_text, buckets)
+
+    def inc(self, name, labels, value=1.0):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.counters[(name, labels)] = value  # Gauges share the counters' storage
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                buckets = self.meta[name][2] or LATENCY_BUCKETS
+                histogram = self.histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            buckets, counts, _, _ = histogram
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    def render(self):
+        by_name = defaultdict(list)
+        with self.lock:
+            # Copy under the lock, format outside it
+            for (name, labels), value in self.counters.items():
+                by_name[name].append((labels, value))
+            for (name, labels), (buckets, counts, total, count) in self.histograms.items():
+                by_name[name].append((labels, (buckets, list(counts), total, count)))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text, _ = self.meta.get(name, ("untyped", "", None))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                if metric_type != "histogram":
+                    lines.append(f"{name}{{{label_str}}} {value}")
+                    continue
+                buckets, counts, total, count = value
+                prefix = f"{label_str}," if label_str else ""
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{label_str}}} {total}")
+                lines.append(f"{name}_count{{{label_str}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("http_request_duration_seconds", "histogram", "Request latency by route")
+METRICS.describe("http_request_db_seconds_total", "counter", "Time spent executing SQL by route")
+METRICS.describe("http_request_db_statements_total", "counter", "SQL statements executed by route")
+METRICS.describe("http_request_rows_total", "counter", "ORM rows loaded by route")
+METRICS.describe("http_request_queue_wait_seconds_total", "counter", "Time handlers waited for a threadpool worker")
+METRICS.describe("http_request_n_plus_one_total", "counter", "Requests flagged for N+1 query patterns (PERF_DEBUG)")
+
+
+# SQLAlchemy hooks: registered on the Engine/Session classes so every engine and
+# session (including scripts and benchmarks with their own engines) is covered.
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if REQUEST_STATS.get() is not None:
+        conn.info.setdefault("perf_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = REQUEST_STATS.get()
+    if stats is None:
+        return
+    starts = conn.info.get("perf_query_start")
+    if starts:
+        stats.db_time += time.perf_counter() - starts.pop()
+    stats.statements += 1
+    if stats.statement_counts is not None:
+        stats.statement_counts[statement] += 1
+
+
+@event.listens_for(Session, "loaded_as_persistent")
+def _loaded_as_persistent(session, instance):
+    stats = REQUEST_STATS.get()
+    if stats is not None:
+        stats.rows += 1
+
+
+async def _stamp_dispatch():
+    # The last dependency of a sync endpoint: it runs on the event loop after every
+    # other dependency, right before FastAPI submits the endpoint to the threadpool
+    stats = REQUEST_STATS.get()
+    if stats is not None:
+        stats.dispatched = time.perf_counter()
+
+
+DISPATCH_PARAM = "_perf_dispatch"
+
+
+def _timed_endpoint(endpoint):
+    """Wrap an endpoint to record queue wait and when the handler returned.
+
+    The wrapper is async exactly when the endpoint is, so FastAPI still runs sync
+    handlers (and their response validation) in the threadpool. Sync wrappers take
+    one extra dependency, _stamp_dispatch, so the queue wait covers only the wait
+    for a worker thread, not body parsing or dependency resolution.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed_async(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                stats = REQUEST_STATS.get()
+                if stats is not None:
+                    stats.handler_end = time.perf_counter()
+        return timed_async
+
+    @functools.wraps(endpoint)
+    def timed_sync(*args, **kwargs):
+        kwargs.pop(DISPATCH_PARAM, None)
+        # The threadpool copies the request's context, so the stats are visible here
+        stats = REQUEST_STATS.get()
+        if stats is not None:
+            if stats.dispatched is not None:
+                stats.queue_wait += time.perf_counter() - stats.dispatched
+            stats.add_thread(threading.get_ident())
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if stats is not None:
+                stats.handler_end = time.perf_counter()
+
+    signature = inspect.signature(endpoint)
+    stamp = inspect.Parameter(DISPATCH_PARAM, inspect.Parameter.KEYWORD_ONLY, default=Depends(_stamp_dispatch))
+    timed_sync.__signature__ = signature.replace(parameters=[*signature.parameters.values(), stamp])
+    return timed_sync
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+
+# route -> (rows, statements) of the smallest result seen, for the N+1 growth check
+_route_baselines = {}
+
+
+def _check_n_plus_one(route, stats):
+    reasons = []
+    if stats.statement_counts:
+        statement, count = max(stats.statement_counts.items(), key=lambda item: item[1])
+        if count > N_PLUS_ONE_THRESHOLD:
+            reasons.append(f"same statement ran {count}x: {' '.join(statement.split())[:100]}")
+
+    baseline = _route_baselines.get(route)
+    if baseline is None or stats.rows < baseline[0]:
+        _route_baselines[route] = (stats.rows, stats.statements)
+    elif stats.rows > baseline[0] and stats.statements > baseline[1]:
+        reasons.append(
+            f"statement count grows with result size "
+            f"({baseline[1]} statements for {baseline[0]} rows, now {stats.statements} for {stats.rows})"
+        )
+
+    if reasons:
+        METRICS.inc("http_request_n_plus_one_total", (("route", route),))
+        print(f"PERF_DEBUG: possible N+1 in {route}: {'; '.join(reasons)}")
+
+
+class PerfMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead) that times every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = REQUEST_STATS.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing(time.perf_counter() - stats.started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_STATS.reset(token)
+            route = scope.get("route")
+            # Label by route template, never the raw path, to keep cardinality bounded
+            route_path = getattr(route, "path", "unmatched")
+            labels = (("method", scope["method"]), ("route", route_path))
+            METRICS.observe("http_request_duration_seconds", labels + (("status", str(status["code"])),), time.perf_counter() - stats.started)
+            METRICS.inc("http_request_db_seconds_total", labels, stats.db_time)
+            METRICS.inc("http_request_db_statements_total", labels, stats.statements)
+            METRICS.inc("http_request_rows_total", labels, stats.rows)
+            METRICS.inc("http_request_queue_wait_seconds_total", labels, stats.queue_wait)
+            if PERF_DEBUG:
+                _check_n_plus_one(f"{scope['method']} {route_path}", stats)
+
+
+def render_metrics():
+    return METRICS.render()
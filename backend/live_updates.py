@@ -0,0 +1,179 @@
+"""Server-Sent Events for live stock and price changes.
+
+    GET /api/stream/products?ids=12,40,41
+
+A single Broadcaster per worker fans out to every open stream. It is fed by the
+catalog change feed (catalog_changes.py), which sees checkout's stock
+deductions and catalog updates from every worker. Changes are coalesced: the
+first change opens a COALESCE_INTERVAL_MS window, and at the end of it one query
+reads stock and price for every changed product that someone is watching. Each
+subscriber keeps only the latest values per product, so a slow client never
+builds up a backlog.
+
+Idle streams cost a coroutine waiting on an Event, with no thread and no DB
+connection, so a worker can hold thousands of them. A comment line is sent
+every KEEPALIVE_SECONDS so proxies keep the connection open.
+
+If the read fails (database busy, connection dropped) nothing is sent: the ids go
+back into the dirty set and are read again after RETRY_SECONDS.
+
+Events:
+    event: snapshot / event: update
+    data: [{"id": 12, "stock_quantity": 3, "price": 18.5}, ...]
+    event: deleted
+    data: [41]
+"""
+import asyncio
+import json
+import os
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+import models
+
+COALESCE_INTERVAL = float(os.getenv("STREAM_COALESCE_INTERVAL_MS", "250")) / 1000
+KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+RETRY_SECONDS = float(os.getenv("STREAM_RETRY_SECONDS", "1"))
+MAX_IDS_PER_STREAM = 100
+
+
+class Subscriber:
+    __slots__ = ("product_ids", "pending", "wakeup")
+
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        self.pending = {}  # product_id -> latest values not yet sent, None once deleted
+        self.wakeup = asyncio.Event()
+
+
+class Broadcaster:
+    """Lives on the event loop; the change feed thread hands it work with call_soon_threadsafe."""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.loop = None
+        self.watchers = {}  # product_id -> set of Subscribers
+        self.dirty = set()
+        self.flush_scheduled = False
+        self.flush_task = None
+
+    def attach(self, feed):
+        feed.subscribe(self._on_feed_changes)
+
+    def _on_feed_changes(self, product_ids, version):
+        # Runs on the feed thread
+        if self.loop is not None and self.watchers:
+            self.loop.call_soon_threadsafe(self.notify, product_ids)
+
+    def subscribe(self, product_ids):
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(product_ids)
+        for product_id in product_ids:
+            self.watchers.setdefault(product_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for product_id in subscriber.product_ids:
+            watchers = self.watchers.get(product_id)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self.watchers[product_id]
+
+    def notify(self, product_ids):
+        if product_ids is None:  # The feed skipped a backlog too large to list: re-read everything watched
+            product_ids = list(self.watchers)
+        self.dirty.update(product_id for product_id in product_ids if product_id in self.watchers)
+        if self.dirty and not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_later(COALESCE_INTERVAL, self._start_flush)
+
+    def _start_flush(self):
+        self.flush_task = asyncio.ensure_future(self._flush())  # Keep a reference so it isn't collected
+
+    def read_products(self, product_ids):
+        """{product_id: values} for `product_ids`, in one query. Blocking; call in a thread."""
+        products = models.Product.__table__
+        with self.bind.connect() as conn:
+            rows = conn.execute(
+                select(products.c.id, products.c.stock_quantity, products.c.price)
+                .where(products.c.id.in_(product_ids))
+            )
+            return {row.id: {"id": row.id, "stock_quantity": row.stock_quantity, "price": row.price} for row in rows}
+
+    async def _flush(self):
+        product_ids, self.dirty = self.dirty, set()
+        if not product_ids:  # Everyone watching them left before a retry
+            self.flush_scheduled = False
+            return
+        try:
+            values = await asyncio.to_thread(self.read_products, sorted(product_ids))
+        except Exception as e:
+            # Never guess values from a failed read: retry the same ids after a pause
+            print(f"Live update flush failed, retrying in {RETRY_SECONDS}s: {e}")
+            self.dirty.update(product_id for product_id in product_ids if product_id in self.watchers)
+            self.loop.call_later(RETRY_SECONDS, self._start_flush)
+            return
+        self.flush_scheduled = False
+        for product_id in product_ids:
+            update = values.get(product_id)  # None: the product was deleted
+            for subscriber in self.watchers.get(product_id, ()):
+                subscriber.pending[product_id] = update
+                subscriber.wakeup.set()
+        if self.dirty:
+            # Changes that arrived during the query get their own window
+            self.flush_scheduled = True
+            self.loop.call_later(COALESCE_INTERVAL, self._start_flush)
+
+
+def _event(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+async def product_events(broadcaster, product_ids):
+    """Values go out as snapshot/update events; products that no longer exist as a deleted event."""
+    subscriber = broadcaster.subscribe(product_ids)
+    try:
+        # Subscribe first, then snapshot, so no change can fall between the two
+        snapshot = await asyncio.to_thread(broadcaster.read_products, sorted(product_ids))
+        yield f"retry: 5000\n{_event('snapshot', list(snapshot.values()))}"
+        missing = sorted(product_ids - snapshot.keys())
+        if missing:
+            yield _event("deleted", missing)
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.wakeup.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            subscriber.wakeup.clear()
+            pending, subscriber.pending = subscriber.pending, {}
+            updates = [values for values in pending.values() if values is not None]
+            deleted = sorted(product_id for product_id, values in pending.items() if values is None)
+            if updates:
+                yield _event("update", updates)
+            if deleted:
+                yield _event("deleted", deleted)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+def create_router(broadcaster):
+    router = APIRouter()
+
+    @router.get("/api/stream/products")
+    async def stream_products(ids: str = Query(..., description="comma-separated product ids")):
+        try:
+            product_ids = {int(part) for part in ids.split(",") if part.strip()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+        if not product_ids or len(product_ids) > MAX_IDS_PER_STREAM:
+            raise HTTPException(status_code=400, detail=f"Pass between 1 and {MAX_IDS_PER_STREAM} product ids")
+        return StreamingResponse(product_events(broadcaster, product_ids), media_type="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Don't let nginx buffer the stream
+        })
+
+    return router
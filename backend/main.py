@@ -1,32 +1,79 @@
+import time
+STARTED_AT = time.perf_counter()
+
 from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+import os
 import uuid
-import requests
-from io import BytesIO
-import base64
-from PIL import Image
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import literal, null, select, union_all
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
+from datetime import datetime
 from pydantic import BaseModel
-from database import SessionLocal, engine
+from database import SessionLocal, engine, start_sqlite_maintenance
 import models
-
-# Create tables (if not already created by seed)
-models.Base.metadata.create_all(bind=engine)
+from instrumentation import PerfMiddleware, TimedRoute, render_metrics
+import profiling
+import admission
+import live_updates
+import exports
+import order_archive
+from admin_auth import require_admin
+from write_batcher import batcher_for, close_all as close_write_batchers
+from catalog_changes import ChangeFeed, ProductCache, current_version
 
 app = FastAPI()
+# Every route records queue wait / serialization time for Server-Timing and /metrics
+app.router.route_class = TimedRoute
 
-# Run migration on startup to ensure DB is up to date
-# REMOVED: Migrations should be run manually or via a release script to prevent race conditions.
+# Migrations and data backfills (update_products.update_data) are NOT run on startup:
+# every worker would rewrite the catalog on every boot. They run from the release step.
 # Use `python backend/migrate_db.py` to migrate.
 @app.on_event("startup")
 def startup_event():
-    from update_products import update_data
-    try:
-        update_data()
-    except Exception as e:
-        print(f"Startup tasks failed: {e}")
+    # Create tables for local SQLite setups. Other databases are managed by migrate_db.py,
+    # and serverless cold starts shouldn't pay for schema reflection.
+    if os.getenv("AUTO_CREATE_SCHEMA", "1" if engine.dialect.name == "sqlite" else "0") == "1":
+        models.Base.metadata.create_all(bind=engine)
+
+    # Periodic PRAGMA optimize / WAL checkpoint (SQLite only)
+    start_sqlite_maintenance()
+    # Follow catalog_changes so this worker's product cache drops entries other workers changed
+    catalog_feed.start()
+    print(f"Worker ready in {(time.perf_counter() - STARTED_AT) * 1000:.1f} ms")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Commit writes still waiting in the group-commit queue before the worker exits
+    close_write_batchers()
+
 
+class FirstRequestTimer:
+    """Reports time-to-first-request (from module import to the first response) once per worker."""
+
+    def __init__(self, app):
+        self.app = app
+        self.reported = False
+
+    async def __call__(self, scope, receive, send):
+        if self.reported or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.reported = True
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                print(f"First request served {(time.perf_counter() - STARTED_AT) * 1000:.1f} ms after import")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+app.add_middleware(FirstRequestTimer)
+# Opt-in (PROFILING_ENABLED=1); must sit inside PerfMiddleware to see the request stats
+profiling.install(app)
+# Per-route-class concurrency limits and queue budgets; sheds with 503 before handlers queue up
+admission.install(app)
+app.add_middleware(PerfMiddleware)
 
 
 # CORS
@@ -128,6 +175,11 @@ class WishlistItem(BaseModel):
 
 # Endpoints
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus text format; counters are per worker process
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/search", response_model=List[Product])
 def search_products(q: str = Query(..., min_length=1), db: Session = Depends(get_db)):
     search_query = f"%{q}%"
@@ -138,15 +190,11 @@ def search_products(q: str = Query(..., min_length=1), db: Session = Depends(get
     ).all()
     return products
 
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from urllib.parse import urlparse
-
 # Rate Limiter Setup
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Shared by all workers on the host (see rate_limit.py). RATE_LIMIT_ENABLED=0 turns limits
+# off for load-test fixtures, where every virtual user shares one IP
+from rate_limit import limiter
 
 # ... (start of optimize_image)
 
@@ -162,6 +210,11 @@ def optimize_image(request: Request, url: str, width: int = 800):
              # Actually, seed data uses google images.
              raise ValueError("Domain not allowed for optimization")
 
+        # Heavy image dependencies are only loaded by the first request that needs them
+        import requests
+        from io import BytesIO
+        from PIL import Image
+
         # Simple proxy and optimize
         # In a real app, you'd cache these results to avoid repeated fetches/processing
         response = requests.get(url, stream=True, timeout=5) # Add timeout to prevent hangs
@@ -216,12 +269,28 @@ def get_products(
 
     return query.all()
 
+# Per-worker product cache, kept coherent across workers by the catalog change feed
+catalog_feed = ChangeFeed(engine)
+product_cache = ProductCache(catalog_feed)
+PRODUCT_COLUMNS = [column.name for column in models.Product.__table__.columns]
+
+# Live stock/price pushes over SSE, fed by the same change feed (see live_updates.py)
+broadcaster = live_updates.Broadcaster(engine)
+broadcaster.attach(catalog_feed)
+app.include_router(live_updates.create_router(broadcaster))
+
 @app.get("/api/products/{product_id}", response_model=Product)
 def get_product(product_id: int, db: Session = Depends(get_db)):
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        return cached
+    generation = product_cache.generation
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    data = {name: getattr(product, name) for name in PRODUCT_COLUMNS}
+    product_cache.put(product_id, data, generation)
+    return data
 
 @app.post("/api/cart", response_model=CartItem)
 @limiter.limit("20/minute")
@@ -270,6 +339,34 @@ def add_to_cart(request: Request, item: CartItemCreate, session_id: str = Depend
 def get_cart(session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
     return db.query(models.CartItem).options(joinedload(models.CartItem.product)).filter(models.CartItem.session_id == session_id).all()
 
+def catalog_version(db: Session):
+    """Current catalog version (highest catalog_changes id); free while the change feed is current."""
+    if catalog_feed.is_current():
+        return str(catalog_feed.version)
+    return str(current_version(db))
+
+@app.get("/api/session/bootstrap")
+def session_bootstrap(request: Request, session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
+    # Everything the first paint needs in one round trip: cart lines and wishlist entries as
+    # product ids, and the catalog version. The client takes the products from its static
+    # catalog (checked against that version) and only asks /api/cart when there is no export.
+    cart, wishlist = [], []
+    if "session_id" in request.cookies:  # A session minted just now has nothing stored yet
+        cart_items = models.CartItem.__table__
+        wishlist_items = models.WishlistItem.__table__
+        rows = db.execute(union_all(
+            select(literal("cart"), cart_items.c.product_id, cart_items.c.quantity)
+            .where(cart_items.c.session_id == session_id, cart_items.c.quantity > 0),
+            select(literal("wishlist"), wishlist_items.c.product_id, null())
+            .where(wishlist_items.c.session_id == session_id),
+        ))
+        for kind, product_id, quantity in rows:
+            if kind == "cart":
+                cart.append({"product_id": product_id, "quantity": quantity})
+            else:
+                wishlist.append(product_id)
+    return {"cart": cart, "wishlist": wishlist, "catalog_version": catalog_version(db)}
+
 @app.post("/api/checkout", response_model=Order)
 def checkout(order_data: OrderCreate, session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
     # 1. Get Cart Items
@@ -341,14 +438,8 @@ def checkout(order_data: OrderCreate, session_id: str = Depends(get_session_id),
 
 @app.post("/api/subscribe")
 def subscribe(subscriber: SubscriberCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.Subscriber).filter(models.Subscriber.email == subscriber.email).first()
-    if existing:
-        return {"message": "Already subscribed"}
-    
-    new_sub = models.Subscriber(email=subscriber.email)
-    db.add(new_sub)
-    db.commit()
-    return {"message": "Subscribed successfully"}
+    # Group-committed with other small writes (see write_batcher.py)
+    return batcher_for(db.get_bind()).submit("subscribe", subscriber.email)
 
 @app.get("/api/wishlist", response_model=List[WishlistItem])
 def get_wishlist(session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
@@ -356,24 +447,62 @@ def get_wishlist(session_id: str = Depends(get_session_id), db: Session = Depend
 
 @app.post("/api/wishlist")
 def add_to_wishlist(item: WishlistItemCreate, session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
-    existing = db.query(models.WishlistItem).filter(
-        models.WishlistItem.session_id == session_id,
-        models.WishlistItem.product_id == item.product_id
-    ).first()
-    
-    if existing:
-        return {"message": "Already in wishlist"}
-
-    new_item = models.WishlistItem(session_id=session_id, product_id=item.product_id)
-    db.add(new_item)
-    db.commit()
-    return {"message": "Added to wishlist"}
+    return batcher_for(db.get_bind()).submit("wishlist_add", session_id, item.product_id)
 
 @app.delete("/api/wishlist/{product_id}")
 def remove_from_wishlist(product_id: int, session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
-    db.query(models.WishlistItem).filter(
-        models.WishlistItem.session_id == session_id,
-        models.WishlistItem.product_id == product_id
-    ).delete()
-    db.commit()
-    return {"message": "Removed from wishlist"}
+    return batcher_for(db.get_bind()).submit("wishlist_remove", session_id, product_id)
+
+# Admin exports for reconciliation, streamed straight from a server-side cursor (see exports.py)
+
+@app.get("/api/admin/export/orders", dependencies=[Depends(require_admin)])
+def export_orders(
+    format: str = "ndjson",
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, gt=0),
+    db: Session = Depends(get_db)
+):
+    if format not in exports.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    # A date export is ordered by (created_at, id), so it resumes from both; ids alone can be out of order
+    by_created = created_from is not None or created_to is not None
+    if by_created and after_id is not None and after_created_at is None:
+        raise HTTPException(status_code=400, detail="Resume a created_at export with after_created_at and after_id")
+    if after_created_at is not None and (not by_created or after_id is None):
+        raise HTTPException(status_code=400, detail="after_created_at needs after_id and a created_from or created_to filter")
+    # The stream opens its own connection: the request's session is closed before the body is sent.
+    # Months moved to the cold archive are read back from it (see order_archive.py)
+    try:
+        chunks = order_archive.export_orders(
+            db.get_bind(), format, created_from, created_to, after_id, limit, after_created_at=after_created_at
+        )
+    except order_archive.ArchiveUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return exports.streaming_response(chunks, format, "orders")
+
+@app.get("/api/admin/export/products", dependencies=[Depends(require_admin)])
+def export_products(
+    format: str = "ndjson",
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, gt=0),
+    db: Session = Depends(get_db)
+):
+    if format not in exports.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    chunks = exports.export_products(db.get_bind(), format, after_id, limit)
+    return exports.streaming_response(chunks, format, "products")
+
+@app.get("/api/admin/orders/{order_id}", dependencies=[Depends(require_admin)])
+def get_order(order_id: int, db: Session = Depends(get_db)):
+    # Orders older than the retention window only exist in the archive (see order_archive.py)
+    try:
+        order = order_archive.find_order(db, order_id)
+    except order_archive.ArchiveUnavailable as e:
+        # Unknown vs. archived can't be told apart without the archive
+        raise HTTPException(status_code=503, detail=str(e))
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
@@ -1,6 +1,7 @@
 from sqlalchemy import text
 from database import engine, SessionLocal
 import models
+from update_products import update_data
 
 def migrate():
     print("Starting Migration...")
@@ -75,8 +76,20 @@ def migrate():
                 print(f"Added/Verified column {col_name}")
             except Exception as e:
                 print(f"Error adding {col_name}: {e}")
-        
+
+        # 4. Create indexes that were added to existing tables
+        # create_all() only builds indexes together with brand new tables
+        print("Creating missing indexes...")
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+                print(f"Added/Verified index {index.name}")
+
         conn.commit()
+
+    # 5. Backfill derived product fields (only rows that are stale)
+    print("Backfilling product info...")
+    update_data()
     print("Migration Complete.")
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -10,7 +10,7 @@ class Product(Base):
     name = Column(String, index=True)
     slug = Column(String, unique=True, index=True)
     description = Column(String)
-    price = Column(Float)
+    price = Column(Float, index=True)
     category = Column(String, index=True)
     stock_quantity = Column(Integer, default=100)
     image_url = Column(String)
@@ -20,6 +20,11 @@ class Product(Base):
     nutritional_info = Column(String, default="{}") # JSON string for flexibility
     sustainability_info = Column(String)
 
+    __table_args__ = (
+        # Category browse with a price range, ordered by price
+        Index("ix_products_category_price", "category", "price"),
+    )
+
 class CartItem(Base):
     __tablename__ = "cart_items"
 
@@ -30,6 +35,10 @@ class CartItem(Base):
 
     product = relationship("Product")
 
+    __table_args__ = (
+        Index("ix_cart_items_session_product", "session_id", "product_id"),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -44,6 +53,11 @@ class Order(Base):
 
     items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        # created_at ranges in id order (time-ranged order exports and archival)
+        Index("ix_orders_created_at_id", "created_at", "id"),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -56,6 +70,11 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
 
+    __table_args__ = (
+        # Items of an order, in id order (order exports join orders to their items)
+        Index("ix_order_items_order_id", "order_id", "id"),
+    )
+
 class Subscriber(Base):
     __tablename__ = "subscribers"
 
@@ -72,3 +91,18 @@ class WishlistItem(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     product = relationship("Product")
+
+    __table_args__ = (
+        Index("ix_wishlist_items_session_product", "session_id", "product_id"),
+    )
+
+class CatalogChange(Base):
+    """Append-only log of product changes. The highest id is the catalog version."""
+    __tablename__ = "catalog_changes"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer) # No FK: deletions are logged too
+    changed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # AUTOINCREMENT so SQLite never reuses ids after old rows are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
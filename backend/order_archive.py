@@ -0,0 +1,473 @@
+"""Cold archival of old orders to compressed Parquet files.
+
+Orders and their items are kept in the hot tables for ORDER_RETENTION_MONTHS
+full months. Older months are closed: the archival job writes each closed month
+to one zstd-compressed Parquet file (one row per order item, like the CSV
+export), records it in manifest.json and then deletes the month from the hot
+tables in batches. Hot tables stay bounded to the retention window no matter how
+much history accumulates.
+
+The archive lives at ORDER_ARCHIVE_URI, which every worker must be able to read:
+an object store (s3://bucket/orders, gs://...) or a shared mount. Only local
+SQLite development falls back to backend/archive/orders. Without an archive
+location the job refuses to run, so nothing is ever purged that the API can't
+read back.
+
+The job is safe to re-run at any point. A month only leaves the hot tables after
+its file is durable and listed in the manifest, and a month that is already
+archived only has leftovers purged.
+
+Reads go through the archive transparently:
+- find_order() looks an order up in the hot tables first and falls back to the
+  archive. The manifest's id ranges pick the file, and Parquet row-group
+  statistics keep the read to the matching row group.
+- export_orders() streams archived months from their files, then the hot rows,
+  one batch at a time: files are written in export order, so nothing is re-sorted
+  in memory.
+If the archive is configured but can't be read, both raise ArchiveUnavailable
+(503) rather than answer as if the orders never existed.
+
+    python order_archive.py                      # archive every closed month
+    python order_archive.py --retention-months 12 --dry-run
+
+Requires the optional `pyarrow` package (only when archiving, or reading the archive).
+The local dev archive is only opened once its manifest exists, so the API runs
+without pyarrow until something has been archived.
+"""
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from database import engine
+import exports
+import models
+
+DEV_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive", "orders")
+# Explicit location, or the local dev default when running on SQLite; None means no archive
+ORDER_ARCHIVE_URI = os.getenv("ORDER_ARCHIVE_URI") or (DEV_ARCHIVE_DIR if engine.dialect.name == "sqlite" else None)
+ORDER_RETENTION_MONTHS = int(os.getenv("ORDER_RETENTION_MONTHS", "6"))
+WRITE_BATCH_ROWS = 50000  # rows per Parquet row group
+DELETE_BATCH = 5000  # orders deleted per transaction
+
+ORDER_COLUMNS = exports.ORDER_FIELDS
+ITEM_COLUMNS = exports.ITEM_FIELDS
+
+
+class ArchiveUnavailable(Exception):
+    """The archive is configured but its manifest or files can't be read."""
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def archive_cutoff(retention_months=ORDER_RETENTION_MONTHS, now=None):
+    """Months starting before this are closed and can be archived."""
+    return add_months(month_start(now or datetime.utcnow()), -retention_months)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The order archive needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    return pa.schema(
+        [("id", pa.int64()), ("customer_name", pa.string()), ("email", pa.string()), ("address", pa.string()),
+         ("city", pa.string()), ("total_amount", pa.float64()), ("status", pa.string()),
+         ("created_at", pa.timestamp("us")), ("product_id", pa.int64()), ("quantity", pa.int64()),
+         ("price_at_purchase", pa.float64())]
+    )
+
+
+class OrderArchive:
+    """Manifest and month files under one URI (local path, s3://, gs://, ...)."""
+
+    def __init__(self, uri):
+        pa, _ = _pyarrow()
+        self.uri = uri
+        if "://" in uri:
+            self.fs, self.base = pa.fs.FileSystem.from_uri(uri)
+        else:
+            self.fs, self.base = pa.fs.LocalFileSystem(), os.path.abspath(uri)
+
+    def path(self, name):
+        return f"{self.base.rstrip('/')}/{name}"
+
+    def _sync(self, path):
+        # Object stores have the object once the upload returns; local files need an fsync
+        if self.fs.type_name == "local":
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+
+    def load_manifest(self):
+        """The manifest, or None if there isn't one yet. Raises ArchiveUnavailable if it can't be read."""
+        try:
+            with self.fs.open_input_stream(self.path("manifest.json")) as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise ArchiveUnavailable(f"Order archive manifest at {self.uri} can't be read: {e}")
+
+    def save_manifest(self, manifest):
+        # Written aside, then moved over the old one (a rename locally, a single PUT on object stores)
+        self.fs.create_dir(self.base, recursive=True)
+        with self.fs.open_output_stream(self.path("manifest.json.tmp")) as f:
+            f.write(json.dumps(manifest, indent=2, sort_keys=True).encode())
+        self._sync(self.path("manifest.json.tmp"))
+        self.fs.move(self.path("manifest.json.tmp"), self.path("manifest.json"))
+
+    def write_month(self, bind, month, name):
+        """Stream one month of orders (joined to their items) into a Parquet file. Returns its stats."""
+        pa, pq = _pyarrow()
+        schema = _schema(pa)
+        names = schema.names
+        statement = exports.orders_statement(created_from=month, created_to=add_months(month, 1))
+        # id_ordered: ids also ascend through the file, so an id-ordered export can stream it as is
+        stats = {"orders": 0, "rows": 0, "min_id": None, "max_id": None, "id_ordered": True}
+        last_id = None
+        buffer = []
+        digest = hashlib.sha256()
+
+        def write_buffer(writer):
+            writer.write_table(pa.Table.from_pylist([dict(zip(names, row)) for row in buffer], schema=schema))
+            buffer.clear()
+
+        self.fs.create_dir(self.base, recursive=True)
+        with pq.ParquetWriter(self.path(f"{name}.tmp"), schema, filesystem=self.fs, compression="zstd") as writer:
+            for chunk in exports._stream_chunks(bind, statement):
+                for row in chunk:
+                    buffer.append(row)
+                    stats["rows"] += 1
+                    if row[0] != last_id:
+                        if last_id is not None and row[0] < last_id:
+                            stats["id_ordered"] = False  # Checkouts committed out of created_at order
+                        last_id = row[0]
+                        stats["orders"] += 1
+                        stats["min_id"] = row[0] if stats["min_id"] is None else min(stats["min_id"], row[0])
+                        stats["max_id"] = row[0] if stats["max_id"] is None else max(stats["max_id"], row[0])
+                if len(buffer) >= WRITE_BATCH_ROWS:
+                    write_buffer(writer)
+            if buffer:
+                write_buffer(writer)
+        if not stats["orders"]:
+            self.fs.delete_file(self.path(f"{name}.tmp"))
+            return stats
+        with self.fs.open_input_stream(self.path(f"{name}.tmp")) as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self._sync(self.path(f"{name}.tmp"))
+        self.fs.move(self.path(f"{name}.tmp"), self.path(name))
+        stats["sha256"] = digest.hexdigest()
+        stats["bytes"] = self.fs.get_file_info(self.path(name)).size
+        return stats
+
+    def rows(self, entry, columns, filters=None):
+        """Yield `columns` tuples from one month file in file order, a batch at a time.
+
+        `filters` are pyarrow DNF filters; row-group statistics skip the groups that can't match.
+        Raises ArchiveUnavailable if the file can't be read.
+        """
+        pa, pq = _pyarrow()
+        try:
+            dataset = pa.dataset.dataset(self.path(entry["file"]), format="parquet", filesystem=self.fs)
+            batches = dataset.to_batches(
+                columns=columns,
+                filter=pq.filters_to_expression(filters) if filters else None,
+                batch_size=exports.EXPORT_CHUNK_SIZE,
+                use_threads=False,  # Keeps the batches in file order
+            )
+            for batch in batches:
+                yield from zip(*[column.to_pylist() for column in batch.columns])
+        except OSError as e:
+            raise ArchiveUnavailable(f"Order archive file {entry['file']} can't be read: {e}")
+
+
+def open_archive(uri=ORDER_ARCHIVE_URI):
+    return OrderArchive(uri) if uri else None
+
+
+def _archive_manifest(uri):
+    """(archive, manifest) to read from, or (None, None) when there is nothing archived."""
+    if uri == DEV_ARCHIVE_DIR and not os.path.exists(os.path.join(uri, "manifest.json")):
+        return None, None  # Local dev before the first archive run: no pyarrow needed
+    archive = open_archive(uri)
+    if archive is None:
+        return None, None
+    manifest = archive.load_manifest()
+    if manifest is None:
+        if uri != DEV_ARCHIVE_DIR:
+            # A configured archive always has a manifest once the job has run; without it we can't tell
+            raise ArchiveUnavailable(f"Order archive manifest missing at {uri}")
+        return None, None
+    return archive, manifest
+
+
+def purge_month(bind, month, entry):
+    """Delete an archived month from the hot tables, only the order ids the archive holds."""
+    orders = models.Order.__table__
+    items = models.OrderItem.__table__
+    in_archive = [
+        orders.c.created_at >= month,
+        orders.c.created_at < add_months(month, 1),
+        orders.c.id.between(entry["min_id"], entry["max_id"]),
+    ]
+    deleted = 0
+    while True:
+        with bind.begin() as conn:
+            ids = conn.execute(select(orders.c.id).where(*in_archive).order_by(orders.c.id).limit(DELETE_BATCH)).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(items).where(items.c.order_id.in_(ids)))
+            # The batch is every matching order in this id stretch, so the delete is a primary key range scan
+            conn.execute(delete(orders).where(orders.c.id.between(ids[0], ids[-1]), *in_archive))
+        deleted += len(ids)
+    with bind.connect() as conn:
+        leftovers = conn.execute(
+            select(func.count()).select_from(orders).where(*in_archive[:2])
+        ).scalar()
+    if leftovers:
+        print(f"{month:%Y-%m}: {leftovers} orders in the hot tables are outside the archived id range; left in place")
+    return deleted
+
+
+def reclaim_space(bind):
+    """Make the space purged rows held reusable right away instead of bloating the tables."""
+    if bind.dialect.name == "postgresql":
+        # VACUUM can't run inside a transaction
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql(f"VACUUM (ANALYZE) {models.OrderItem.__tablename__}, {models.Order.__tablename__}")
+    # SQLite puts the freed pages on its freelist and reuses them for new rows;
+    # a full VACUUM would rewrite the whole database file, so it is left to maintenance windows
+
+
+def months_to_archive(bind, cutoff):
+    orders = models.Order.__table__
+    with bind.connect() as conn:
+        oldest = conn.execute(select(func.min(orders.c.created_at)).where(orders.c.created_at < cutoff)).scalar()
+    months = []
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archive_orders(bind=engine, retention_months=ORDER_RETENTION_MONTHS, uri=ORDER_ARCHIVE_URI, dry_run=False):
+    """Archive and purge every closed month. Returns {month: summary}."""
+    archive = open_archive(uri)
+    if archive is None:
+        raise RuntimeError("Set ORDER_ARCHIVE_URI to storage every worker can read (e.g. s3://bucket/orders)")
+    cutoff = archive_cutoff(retention_months)
+    manifest = archive.load_manifest() or {"months": {}}
+    summary = {}
+    purged = 0
+    for month in months_to_archive(bind, cutoff):
+        key = f"{month:%Y-%m}"
+        entry = manifest["months"].get(key)
+        if entry is None:
+            if dry_run:
+                summary[key] = "would archive"
+                continue
+            started = time.perf_counter()
+            filename = f"orders-{key}.parquet"
+            stats = archive.write_month(bind, month, filename)
+            if not stats["orders"]:
+                continue
+            entry = dict(stats, file=filename, archived_at=datetime.utcnow().isoformat() + "Z")
+            manifest["months"][key] = entry
+            archive.save_manifest(manifest)
+            print(f"{key}: archived {stats['orders']} orders ({stats['rows']} rows, {entry['bytes']} bytes) "
+                  f"in {time.perf_counter() - started:.1f}s")
+        if dry_run:
+            summary[key] = "would purge"
+            continue
+        deleted = purge_month(bind, month, entry)
+        if deleted:
+            print(f"{key}: removed {deleted} orders from the hot tables")
+        purged += deleted
+        summary[key] = {"archived": entry["orders"], "purged": deleted}
+    if not dry_run:
+        archive.save_manifest(manifest)  # Also marks a new archive as initialised, even if empty
+        if purged:
+            reclaim_space(bind)
+    return summary
+
+
+def find_order(db, order_id, uri=ORDER_ARCHIVE_URI):
+    """An order with its items from the hot tables, else from the archive; None if unknown."""
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if order is not None:
+        data = {name: getattr(order, name) for name in ORDER_COLUMNS}
+        data["items"] = [{name: getattr(item, name) for name in ITEM_COLUMNS} for item in order.items]
+        data["archived"] = False
+        return data
+    archive, manifest = _archive_manifest(uri)
+    if manifest is None:
+        return None
+    for entry in manifest["months"].values():
+        if not entry["min_id"] <= order_id <= entry["max_id"]:
+            continue
+        columns = ORDER_COLUMNS + ITEM_COLUMNS
+        rows = [dict(zip(columns, row)) for row in archive.rows(entry, columns, filters=[("id", "=", order_id)])]
+        if rows:
+            data = {name: rows[0][name] for name in ORDER_COLUMNS}
+            data["items"] = [{name: row[name] for name in ITEM_COLUMNS} for row in rows if row["product_id"] is not None]
+            data["archived"] = True
+            return data
+    return None
+
+
+def _month_rows(archive, entry, columns, filters, by_id):
+    """One month's rows in export order: as written ((created_at, id)), or by id."""
+    rows = archive.rows(entry, columns, filters)
+    if by_id and not entry.get("id_ordered"):
+        # Only months where checkouts committed out of created_at order (or archived before
+        # id_ordered was recorded) are sorted; the stable sort keeps each order's items in place
+        return iter(sorted(rows, key=lambda row: row[0]))
+    return rows
+
+
+def _id_runs(months):
+    """Months by id, grouped into runs whose id ranges overlap."""
+    runs, run_max = [], None
+    for entry in sorted(months, key=lambda entry: entry["min_id"]):
+        if runs and entry["min_id"] <= run_max:
+            runs[-1].append(entry)
+        else:
+            runs.append([entry])
+            run_max = entry["max_id"]
+        run_max = max(run_max, entry["max_id"])
+    return runs
+
+
+def _archived_rows(archive, months, created_from, created_to, after_id, after_created_at):
+    """Archived rows in the order of exports.orders_statement() rows."""
+    by_created = created_from is not None or created_to is not None
+    columns = ORDER_COLUMNS + ITEM_COLUMNS
+    filters = []
+    if created_from is not None:
+        filters.append(("created_at", ">=", created_from))
+    if created_to is not None:
+        filters.append(("created_at", "<", created_to))
+    if after_created_at is not None:
+        # (created_at, id) > (after_created_at, after_id), as two alternatives (DNF)
+        filters = [
+            filters + [("created_at", ">", after_created_at)],
+            filters + [("created_at", "=", after_created_at), ("id", ">", after_id)],
+        ]
+    elif after_id is not None:
+        filters.append(("id", ">", after_id))
+    if by_created:
+        # Month files are written in (created_at, id) order and months don't overlap in time
+        return itertools.chain.from_iterable(archive.rows(entry, columns, filters) for entry in months)
+    # Neighbouring months can share a few ids (an order stamped before midnight that
+    # committed after one stamped after it), so those are merged by id
+    return itertools.chain.from_iterable(
+        heapq.merge(*[_month_rows(archive, entry, columns, filters, True) for entry in run], key=lambda row: row[0])
+        for run in _id_runs(months)
+    )
+
+
+def _limit_chunks(rows, limit):
+    """Yield rows in chunks of EXPORT_CHUNK_SIZE, stopping after `limit` orders. Returns the order count."""
+    orders, last_id, chunk = 0, None, []
+    for row in rows:
+        if row[0] != last_id:
+            if limit is not None and orders == limit:
+                break
+            last_id = row[0]
+            orders += 1
+        chunk.append(row)
+        if len(chunk) >= exports.EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+    return orders
+
+
+def export_orders(bind, fmt, created_from=None, created_to=None, after_id=None, limit=None,
+                  after_created_at=None, uri=ORDER_ARCHIVE_URI):
+    """exports.export_orders over the archive and the hot tables together.
+
+    By created_at, archived months come first: they are older than every hot month.
+    By id, archived and hot rows are merged, as ids around the archive cutoff can
+    interleave. Hot rows that an interrupted purge left behind are skipped, as the
+    archive already holds them.
+    """
+    archive, manifest = _archive_manifest(uri)  # Raises ArchiveUnavailable before the response starts
+    if not manifest or not manifest["months"]:
+        return exports.export_orders(bind, fmt, created_from, created_to, after_id, limit, after_created_at)
+
+    by_created = created_from is not None or created_to is not None
+    months = []
+    for key, entry in sorted(manifest["months"].items()):
+        start = datetime.strptime(key, "%Y-%m")
+        if created_from is not None and add_months(start, 1) <= created_from:
+            continue
+        if created_to is not None and start >= created_to:
+            continue
+        if after_created_at is not None and add_months(start, 1) <= after_created_at:
+            continue
+        if not by_created and after_id is not None and entry["max_id"] <= after_id:
+            continue
+        months.append(entry)
+    archived_until = add_months(datetime.strptime(max(manifest["months"]), "%Y-%m"), 1)
+
+    def chunks():
+        archived = _archived_rows(archive, months, created_from, created_to, after_id, after_created_at)
+        if not by_created:
+            # No SQL limit: the leftover rows dropped here would use it up
+            created_at = ORDER_COLUMNS.index("created_at")
+            statement = exports.orders_statement(None, None, after_id)
+            hot = (row for chunk in exports._stream_chunks(bind, statement) for row in chunk if row[created_at] >= archived_until)
+            yield from _limit_chunks(heapq.merge(archived, hot, key=lambda row: row[0]), limit)
+            return
+        count = yield from _limit_chunks(archived, limit)
+        remaining = None if limit is None else limit - count
+        hot_from = max(created_from, archived_until) if created_from is not None else archived_until
+        if remaining == 0 or (created_to is not None and hot_from >= created_to):
+            return
+        yield from exports._stream_chunks(bind, exports.orders_statement(hot_from, created_to, after_id, remaining, after_created_at))
+
+    return exports.format_orders(chunks(), fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-months", type=int, default=ORDER_RETENTION_MONTHS,
+                        help="full months kept in the hot tables")
+    parser.add_argument("--archive-uri", default=ORDER_ARCHIVE_URI, help="local path or s3:// / gs:// URI")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    summary = archive_orders(engine, args.retention_months, args.archive_uri, args.dry_run)
+    if not summary:
+        print(f"Nothing to archive before {archive_cutoff(args.retention_months):%Y-%m}")
+    elif args.dry_run:
+        for month, action in summary.items():
+            print(f"{month}: {action}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""On-demand sampling profiler for production requests.
+
+Disabled unless PROFILING_ENABLED=1; when disabled nothing is installed, so there
+is no per-request cost at all. When enabled, an admin (X-Admin-Token) can:
+
+- profile a single request by sending `X-Profile: 1` (or `?__profile=1`). The
+  worker threads running that request's sync handler and the event-loop thread
+  (async handlers, middleware) are sampled until the response is sent.
+- profile every thread for a time window: POST /api/admin/profile?seconds=10
+
+Profiles are written as collapsed stacks ("frame;frame;frame count" per line),
+which speedscope, flamegraph.pl and most flamegraph viewers load directly, next
+to a .json file with the request metadata. Fetch them from /api/admin/profiles.
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import MutableHeaders
+
+from admin_auth import is_admin_token, require_admin
+from instrumentation import current_stats
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "nutmunch-profiles"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "2")) / 1000
+MAX_WINDOW_SECONDS = 60
+
+# Innermost frames of threads that are just waiting for work; skipped in window mode
+IDLE_LEAVES = {"wait", "select", "poll", "_worker", "get", "sleep", "accept"}
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+$")
+
+
+class StackSampler:
+    """Samples Python stacks of selected threads (or all threads) on a background thread."""
+
+    def __init__(self, thread_ids=None, interval=SAMPLE_INTERVAL, skip_idle=False, idle_thread_ids=()):
+        self.thread_ids = thread_ids  # callable returning the threads to sample now, or None for all threads
+        self.interval = interval
+        self.skip_idle = skip_idle
+        self.idle_thread_ids = idle_thread_ids  # threads whose idle samples are skipped even without skip_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            targets = frames.keys() if self.thread_ids is None else self.thread_ids()
+            for thread_id in targets:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                if (self.skip_idle or thread_id in self.idle_thread_ids) and frame.f_code.co_name in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def new_profile_name(kind):
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{kind}"
+
+
+def save_profile(sampler, name, kind, metadata):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{name}.collapsed"), "w") as f:
+        f.write(sampler.collapsed())
+    metadata = dict(
+        metadata,
+        kind=kind,
+        samples=sampler.samples,
+        interval_ms=sampler.interval * 1000,
+        empty=not sampler.stacks,  # nothing ran Python code in the sampled threads
+        duration_ms=sampler.duration * 1000,
+        captured_at=datetime.utcnow().isoformat() + "Z",
+    )
+    with open(os.path.join(PROFILE_DIR, f"{name}.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return name
+
+
+def _wants_profile(scope):
+    headers = dict(scope["headers"])
+    flagged = headers.get(b"x-profile") == b"1" or b"__profile=1" in scope.get("query_string", b"")
+    return flagged and is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1"))
+
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it. Must run inside PerfMiddleware (needs the request stats)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            return await self.app(scope, receive, send)
+
+        stats = current_stats()
+        # Sync handlers run on worker threads that register in stats once they pick the
+        # request up; async handlers run here, on the event-loop thread (idle samples skipped)
+        loop_thread = threading.get_ident()
+        sampler = StackSampler(
+            thread_ids=lambda: (stats.threads() if stats else set()) | {loop_thread},
+            idle_thread_ids={loop_thread},
+        ).start()
+        status = {"code": None}
+        name = new_profile_name("request")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", name)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            route = scope.get("route")
+            save_profile(sampler, name, "request", {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "route": getattr(route, "path", None),
+                "status": status["code"],
+                "client": scope.get("client", [None])[0],
+                "db_ms": stats.db_time * 1000 if stats else None,
+                "statements": stats.statements if stats else None,
+            })
+            print(f"Profile saved: {name} ({scope['method']} {scope['path']})")
+
+
+router = APIRouter(prefix="/api/admin", dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_window(seconds: float = Query(10, gt=0, le=MAX_WINDOW_SECONDS)):
+    """Sample every thread for `seconds` and return the collapsed stacks."""
+    sampler = StackSampler(skip_idle=True).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(sampler.stop)
+    name = new_profile_name("window")
+    save_profile(sampler, name, "window", {"seconds": seconds})
+    return PlainTextResponse(sampler.collapsed(), headers={"X-Profile-Id": name})
+
+
+@router.get("/profiles")
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if filename.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, filename)) as f:
+                profiles.append(dict(json.load(f), id=filename[:-len(".json")]))
+    return profiles
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str):
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.collapsed")
+    if not PROFILE_NAME_RE.match(profile_id) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path) as f:
+        return PlainTextResponse(f.read())
+
+
+def install(app):
+    """Add the profiling middleware and admin routes, only when PROFILING_ENABLED=1."""
+    if not PROFILING_ENABLED:
+        return
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(router)
@@ -0,0 +1,222 @@
+"""Rate limiting shared by every worker on the host.
+
+GCRA (the generic cell rate algorithm, an exact token bucket that stores a single
+timestamp per key) keeps each check O(1): one keyed upsert, no counters to sum.
+
+Backends, picked with RATE_LIMIT_BACKEND:
+- sqlite (default): one small WAL-mode SQLite file in the temp dir shared by all
+  uvicorn workers on the host; one UPSERT ... RETURNING statement per check.
+- redis: the same algorithm as an atomic Lua script, for limits shared across
+  hosts (REDIS_URL, requires the `redis` package).
+- memory: per-process only; for tests and single-worker setups.
+
+If the shared backend fails (SQLite busy past its timeout, Redis unreachable),
+the check falls back to a per-process memory backend instead of failing the
+request: a limiter fault must never take down checkout.
+
+Idle keys (whose bucket has refilled completely) carry no information and are
+evicted periodically, so state stays bounded by the number of active clients.
+
+    @app.post("/api/cart")
+    @limiter.limit("20/minute")
+    def add_to_cart(request: Request, ...):
+"""
+import functools
+import inspect
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fastapi import HTTPException, Request
+
+from instrumentation import METRICS
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "nutmunch-ratelimit.db"))
+EVICT_INTERVAL = 60  # seconds between idle-key sweeps
+
+METRICS.describe("rate_limit_backend_errors_total", "counter", "Rate limit checks the shared backend failed, answered by the memory fallback")
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(limit):
+    """'20/minute' -> (20, 60.0)"""
+    count, _, period = limit.partition("/")
+    return int(count), float(PERIODS[period.strip().rstrip("s")])
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.tats = {}
+        self.lock = threading.Lock()
+        self.next_evict = time.monotonic() + EVICT_INTERVAL
+
+    def hit(self, key, interval, period, now):
+        """Return 0 if allowed, else seconds until the request would be allowed."""
+        with self.lock:
+            tat = max(self.tats.get(key, now), now) + interval
+            if tat - now > period:
+                return tat - now - period
+            self.tats[key] = tat
+            if now > self.next_evict:
+                self.next_evict = now + EVICT_INTERVAL
+                self.tats = {k: v for k, v in self.tats.items() if v > now}
+            return 0
+
+
+class SQLiteBackend:
+    # Insert a fresh key, or advance its TAT only if the request conforms.
+    # No row comes back when the WHERE rejects the update, i.e. when limited.
+    UPSERT = (
+        "INSERT INTO rate_limits (key, tat) VALUES (:key, :now + :interval) "
+        "ON CONFLICT(key) DO UPDATE SET tat = max(tat, :now) + :interval "
+        "WHERE max(tat, :now) + :interval - :now <= :period "
+        "RETURNING tat"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.evict_lock = threading.Lock()
+        self.next_evict = 0.0
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit: every statement is its own tiny transaction
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Losing limiter state on power loss is harmless
+            conn.execute("PRAGMA busy_timeout=1000")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+            self.local.conn = conn
+        return conn
+
+    def hit(self, key, interval, period, now):
+        conn = self._connect()
+        params = {"key": key, "now": now, "interval": interval, "period": period}
+        try:
+            row = conn.execute(self.UPSERT, params).fetchone()
+        except sqlite3.DatabaseError:
+            # Reconnect on the next check in case the file was replaced or the connection broke
+            self.local.conn = None
+            conn.close()
+            raise
+        if row is not None:
+            if now > self.next_evict:
+                self._evict(conn, now)
+            return 0
+        row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] + interval - now - period) if row else 0
+
+    def _evict(self, conn, now):
+        if not self.evict_lock.acquire(blocking=False):
+            return
+        try:
+            self.next_evict = now + EVICT_INTERVAL
+            conn.execute("DELETE FROM rate_limits WHERE tat < ?", (now,))
+        finally:
+            self.evict_lock.release()
+
+
+class RedisBackend:
+    # Same GCRA step as SQLiteBackend.UPSERT, atomic inside Redis. Keys expire once idle.
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local period = tonumber(ARGV[3])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    tat = math.max(tat, now) + interval
+    if tat - now > period then
+        return tostring(tat - now - period)
+    end
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+    return '0'
+    """
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def hit(self, key, interval, period, now):
+        return float(self.script(keys=[f"ratelimit:{key}"], args=[now, interval, period]))
+
+
+def backend_from_env():
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend()
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return SQLiteBackend(RATE_LIMIT_DB)
+
+
+def client_address(request: Request):
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, backend=None, key_func=client_address, enabled=RATE_LIMIT_ENABLED):
+        self.backend = backend
+        self.key_func = key_func
+        self.enabled = enabled
+        self.fallback = MemoryBackend()
+        self.next_error_log = 0.0
+
+    def _hit(self, key, interval, period, now):
+        try:
+            if self.backend is None:
+                # Created lazily so importing the app never touches the filesystem
+                self.backend = backend_from_env()
+            return self.backend.hit(key, interval, period, now)
+        except Exception as e:
+            METRICS.inc("rate_limit_backend_errors_total", (("backend", RATE_LIMIT_BACKEND),))
+            if now > self.next_error_log:
+                self.next_error_log = now + EVICT_INTERVAL  # At most one log line a minute
+                print(f"Rate limit backend failed, limiting per process: {e}")
+            return self.fallback.hit(key, interval, period, now)
+
+    def check(self, request: Request, scope, count, period):
+        """Raise 429 with Retry-After if `request` exceeds `count` per `period` seconds for `scope`."""
+        if not self.enabled:
+            return
+        key = f"{scope}:{self.key_func(request)}"
+        # Wall clock, not monotonic: it has to agree across worker processes
+        retry_after = self._hit(key, period / count, period, time.time())
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {count} per {int(period)} seconds",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def limit(self, limit_string):
+        """Decorator for endpoints that take a `request: Request` argument."""
+        count, period = parse_limit(limit_string)
+
+        def decorator(func):
+            scope = func.__name__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    self.check(kwargs["request"], scope, count, period)
+                    return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                self.check(kwargs["request"], scope, count, period)
+                return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+
+limiter = RateLimiter()
@@ -0,0 +1,120 @@
+"""Cold-start profiler.
+
+Boots the app in a fresh interpreter under `python -X importtime` and reports:
+- an import-time breakdown aggregated by top-level package
+- time to import main, to finish startup handlers, and to serve a first request
+
+    python startup_profile.py            # human readable
+    python startup_profile.py --json     # one JSON object, for tracking as a metric
+    python startup_profile.py --top 25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORTED_MARKER = "##startup-profile: main imported"
+
+# Runs in the child interpreter. Import-time lines after the marker (TestClient etc.)
+# belong to the profiler, not to the app, and are ignored.
+CHILD_SNIPPET = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+print({IMPORTED_MARKER!r}, file=sys.stderr, flush=True)
+from fastapi.testclient import TestClient
+t2 = time.perf_counter()
+with TestClient(main.app) as client:
+    t3 = time.perf_counter()
+    status = client.get("/api/products").status_code
+    t4 = time.perf_counter()
+print(json.dumps({{
+    "import_main_ms": (t1 - t0) * 1000,
+    "startup_ms": (t3 - t2) * 1000,
+    "first_request_ms": (t4 - t3) * 1000,
+    "first_request_status": status,
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Yield (depth, module, self_us, cumulative_us) for each import-time line before the marker."""
+    for line in stderr.splitlines():
+        if line.startswith(IMPORTED_MARKER):
+            break
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        name = name[1:]  # one separator space, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip())) // 2
+        yield depth, name.strip(), int(self_us), int(cumulative_us)
+
+
+def profile_startup(top=15):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    started = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if started.returncode != 0:
+        raise RuntimeError(f"Profiled startup failed:\n{started.stderr[-4000:]}")
+
+    timings = json.loads(started.stdout.strip().splitlines()[-1])
+
+    by_package = defaultdict(int)
+    app_imports = []
+    children = []
+    total_us = 0
+    # Children are reported before their parent, so collect depth-1 lines until "main" closes them
+    for depth, module, self_us, cumulative_us in parse_importtime(started.stderr):
+        by_package[module.split(".")[0]] += self_us
+        total_us += self_us
+        if depth == 1:
+            children.append((module, cumulative_us))
+        elif depth == 0:
+            if module == "main":
+                app_imports = children
+            children = []
+
+    timings["import_total_ms"] = total_us / 1000
+    timings["time_to_ready_ms"] = timings["import_main_ms"] + timings["startup_ms"]
+    timings["packages"] = {
+        name: us / 1000
+        for name, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    }
+    timings["app_imports"] = {
+        name: us / 1000
+        for name, us in sorted(app_imports, key=lambda item: item[1], reverse=True)[:top]
+    }
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", action="store_true", help="print a single JSON object")
+    parser.add_argument("--top", type=int, default=15, help="number of packages/modules to list")
+    args = parser.parse_args()
+
+    timings = profile_startup(top=args.top)
+    if args.json:
+        print(json.dumps(timings))
+        return
+
+    print(f"Import main:        {timings['import_main_ms']:8.1f} ms")
+    print(f"Startup handlers:   {timings['startup_ms']:8.1f} ms")
+    print(f"Time to ready:      {timings['time_to_ready_ms']:8.1f} ms")
+    print(f"First request:      {timings['first_request_ms']:8.1f} ms (status {timings['first_request_status']})")
+    print(f"\nImport self-time by package (total {timings['import_total_ms']:.1f} ms):")
+    for name, ms in timings["packages"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+    print("\nSlowest imports made by main (cumulative):")
+    for name, ms in timings["app_imports"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Deterministic synthetic data generator.
+
+Builds catalogs, sessions, carts, wishlists and order histories at a chosen scale.
+The same tier and seed always produce the same rows, so benchmark results are
+comparable between runs and machines.
+
+    python synthetic_data.py --tier 10k --database-url sqlite:///./bench_10k.db
+    python synthetic_data.py --products 250000 --orders 2000000 --database-url postgresql://...
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from database import create_db_engine
+import models
+
+CHUNK_SIZE = 10000
+
+# sessions: distinct shoppers; carts/wishlists are spread over them.
+TIERS = {
+    "1k": dict(products=1_000, sessions=1_000, cart_lines=3_000, wishlist_lines=2_000, orders=5_000),
+    "10k": dict(products=10_000, sessions=10_000, cart_lines=30_000, wishlist_lines=20_000, orders=50_000),
+    "100k": dict(products=100_000, sessions=50_000, cart_lines=150_000, wishlist_lines=100_000, orders=500_000),
+    "1m": dict(products=1_000_000, sessions=200_000, cart_lines=600_000, wishlist_lines=400_000, orders=1_000_000),
+}
+LINES_PER_ORDER = (1, 5)  # order_items per order, uniform; the 1m tier yields ~3M order lines
+
+CATEGORIES = ["Roasted", "Raw", "Confection", "Reserve"]
+NUTS = ["Almonds", "Pistachios", "Cashews", "Walnuts", "Macadamias", "Hazelnuts", "Pecans", "Pumpkin Seeds"]
+STYLES = ["Sea Salt", "Honey Glazed", "Smoked", "Organic", "Dark Chocolate", "Truffle", "Himalayan Salt", "Raw"]
+ORIGINS = ["USA (California)", "Iran (Kerman)", "Global", "Belgium", "Vietnam", "Australia", "Turkey", "Chile"]
+EPOCH = datetime(2024, 1, 1)
+
+
+def session_id(i):
+    return f"bench-session-{i:08d}"
+
+
+def _insert_chunks(conn, table, rows):
+    chunk = []
+    count = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.execute(insert(table), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        conn.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def _products(rng, count):
+    for i in range(1, count + 1):
+        style, nut = rng.choice(STYLES), rng.choice(NUTS)
+        yield {
+            "id": i,
+            "name": f"{style} {nut} {i}",
+            "slug": f"{style}-{nut}-{i}".lower().replace(" ", "-").replace("(", "").replace(")", ""),
+            "description": f"{style} {nut.lower()} sourced for synthetic benchmark tier, lot {i}.",
+            "price": round(rng.uniform(8, 60), 2),
+            "category": rng.choice(CATEGORIES),
+            "stock_quantity": rng.randint(50, 5000),
+            "image_url": "https://images.unsplash.com/photo-1506103859296-1c00aa16d99f",
+            "weight": rng.choice(["250g", "400g", "500g", "1kg"]),
+            "grade": rng.choice(["Premium", "Reserve"]),
+            "origin": rng.choice(ORIGINS),
+            "nutritional_info": "{}",
+            "sustainability_info": "",
+        }
+
+
+def _session_lines(rng, lines, sessions, products):
+    """Yield unique (session, product) pairs, spread over sessions."""
+    seen = set()
+    while len(seen) < lines:
+        pair = (rng.randrange(sessions), rng.randint(1, products))
+        if pair not in seen:
+            seen.add(pair)
+            yield pair
+
+
+def generate(engine, products, sessions, cart_lines, wishlist_lines, orders, seed=42):
+    """Create the schema and fill it. Returns {table: rows inserted}."""
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    counts = {}
+    with engine.begin() as conn:
+        counts["products"] = _insert_chunks(conn, models.Product.__table__, _products(rng, products))
+        counts["cart_items"] = _insert_chunks(conn, models.CartItem.__table__, (
+            {"session_id": session_id(s), "product_id": p, "quantity": rng.randint(1, 4)}
+            for s, p in _session_lines(rng, cart_lines, sessions, products)
+        ))
+        counts["wishlist_items"] = _insert_chunks(conn, models.WishlistItem.__table__, (
+            {"session_id": session_id(s), "product_id": p, "created_at": EPOCH + timedelta(minutes=rng.randrange(1_000_000))}
+            for s, p in _session_lines(rng, wishlist_lines, sessions, products)
+        ))
+
+        order_rows = []
+        item_rows = []
+        counts["orders"] = counts["order_items"] = 0
+        span_minutes = 2 * 365 * 24 * 60
+        for order_id in range(1, orders + 1):
+            total = 0.0
+            for _ in range(rng.randint(*LINES_PER_ORDER)):
+                quantity = rng.randint(1, 3)
+                price = round(rng.uniform(8, 60), 2)
+                total += price * quantity
+                item_rows.append({
+                    "order_id": order_id, "product_id": rng.randint(1, products),
+                    "quantity": quantity, "price_at_purchase": price,
+                })
+            order_rows.append({
+                "id": order_id,
+                "customer_name": f"Customer {rng.randrange(sessions)}",
+                "email": f"customer{order_id}@example.com",
+                "address": f"{rng.randint(1, 999)} Orchard Lane",
+                "city": rng.choice(["London", "Mumbai", "Austin", "Berlin", "Sydney"]),
+                "total_amount": round(total, 2),
+                "status": "completed",
+                # Sorted by id so created_at grows with id, like real traffic
+                "created_at": EPOCH + timedelta(minutes=order_id * span_minutes // max(orders, 1)),
+            })
+            if len(order_rows) >= CHUNK_SIZE:
+                counts["orders"] += _insert_chunks(conn, models.Order.__table__, order_rows)
+                counts["order_items"] += _insert_chunks(conn, models.OrderItem.__table__, item_rows)
+                order_rows, item_rows = [], []
+        counts["orders"] += _insert_chunks(conn, models.Order.__table__, order_rows)
+        counts["order_items"] += _insert_chunks(conn, models.OrderItem.__table__, item_rows)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="target database (must be empty)")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    for name in TIERS["1k"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, help=f"override the tier's {name}")
+    args = parser.parse_args()
+
+    config = dict(TIERS[args.tier])
+    for name in config:
+        if getattr(args, name) is not None:
+            config[name] = getattr(args, name)
+
+    engine = create_db_engine(args.database_url)
+    started = time.perf_counter()
+    counts = generate(engine, seed=args.seed, **config)
+    print(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
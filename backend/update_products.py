@@ -1,37 +1,93 @@
-from database import SessionLocal, engine
+from sqlalchemy import bindparam, select, update
+from database import engine
+from catalog_changes import record_changes
 import models
 import json
 
-def update_data():
-    db = SessionLocal()
-    products = db.query(models.Product).all()
-    
-    for p in products:
-        # Default data mapping based on category or ID
-        nutrition = {
-            "Calories": "579 kcal",
-            "Protein": "21.2 g",
-            "Healthy Fats": "49.9 g",
-            "Vitamin E": "26.2 mg"
-        }
-        
-        sustainability = f"Sourced from the heart of the {p.origin} region. Our orchards have been cultivated for generations, ensuring the perfect balance of soil nutrients and climate."
-        
-        if "Salt" in p.name:
-            nutrition["Sodium"] = "150 mg"
-        if "Honey" in p.name:
-            nutrition["Sugars"] = "12 g"
-            
-        p.nutritional_info = json.dumps(nutrition)
-        p.sustainability_info = sustainability
-        
-        # Also ensure stock is set if 0/None
-        if not p.stock_quantity:
-            p.stock_quantity = 100
-
-    db.commit()
-    print(f"Updated {len(products)} products with extended info.")
-    db.close()
+BATCH_SIZE = 1000
+
+
+def derive_product_info(name, origin):
+    """Return the (nutritional_info, sustainability_info) a product should have."""
+    # Default data mapping based on category or ID
+    nutrition = {
+        "Calories": "579 kcal",
+        "Protein": "21.2 g",
+        "Healthy Fats": "49.9 g",
+        "Vitamin E": "26.2 mg"
+    }
+
+    sustainability = f"Sourced from the heart of the {origin} region. Our orchards have been cultivated for generations, ensuring the perfect balance of soil nutrients and climate."
+
+    name = name or ""
+    if "Salt" in name:
+        nutrition["Sodium"] = "150 mg"
+    if "Honey" in name:
+        nutrition["Sugars"] = "12 g"
+
+    return json.dumps(nutrition), sustainability
+
+
+def update_data(batch_size=BATCH_SIZE):
+    """Backfill the derived product fields. Out-of-band data migration.
+
+    Streams only the columns it needs and writes only rows whose derived
+    fields are stale, so a second run touches nothing. Run it from the
+    release step (migrate_db.py does), never from worker startup.
+    """
+    products = models.Product.__table__
+    stmt = (
+        update(products)
+        .where(products.c.id == bindparam("_id"))
+        .values(
+            nutritional_info=bindparam("_nutritional_info"),
+            sustainability_info=bindparam("_sustainability_info"),
+            stock_quantity=bindparam("_stock_quantity"),
+        )
+    )
+
+    scanned = 0
+    updated = 0
+    stale = []
+
+    def flush():
+        nonlocal updated
+        if stale:
+            with engine.begin() as write_conn:
+                write_conn.execute(stmt, stale)
+                record_changes(write_conn, [row["_id"] for row in stale])
+            updated += len(stale)
+            stale.clear()
+
+    with engine.connect() as conn:
+        rows = conn.execution_options(yield_per=batch_size).execute(
+            select(
+                products.c.id,
+                products.c.name,
+                products.c.origin,
+                products.c.nutritional_info,
+                products.c.sustainability_info,
+                products.c.stock_quantity,
+            ).order_by(products.c.id)
+        )
+        for row in rows:
+            scanned += 1
+            nutrition, sustainability = derive_product_info(row.name, row.origin)
+            # Only fill in missing stock; 0 means sold out and must stay that way
+            stock = 100 if row.stock_quantity is None else row.stock_quantity
+            if (nutrition, sustainability, stock) != (row.nutritional_info, row.sustainability_info, row.stock_quantity):
+                stale.append({
+                    "_id": row.id,
+                    "_nutritional_info": nutrition,
+                    "_sustainability_info": sustainability,
+                    "_stock_quantity": stock,
+                })
+            if len(stale) >= batch_size:
+                flush()
+    flush()
+
+    print(f"Scanned {scanned} products, updated {updated} with stale extended info.")
+    return updated
 
 if __name__ == "__main__":
     update_data()
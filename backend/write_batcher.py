@@ -0,0 +1,184 @@
+"""Group commit for small, idempotent writes (newsletter signups, wishlist add/remove).
+
+Each of these writes is a single tiny row, so on their own they are dominated by
+the commit: an fsync on SQLite, a network round trip on remote Postgres. Instead
+of committing per request, endpoints submit the write here and block until it
+is durable. A background thread collects everything submitted within
+WRITE_BATCH_MAX_DELAY_MS (or up to WRITE_BATCH_MAX_ITEMS writes), applies it as
+a few set-based statements (one SELECT for what already exists, one multi-row
+INSERT or DELETE per kind of write) and commits once for the whole batch.
+
+If the batch fails (e.g. an email inserted concurrently by another worker hits
+the unique index), it is rolled back and every write is retried once on its own.
+The writes are idempotent, so the retry simply sees the concurrent row, and a
+genuinely bad write only fails its own request.
+
+    result = batcher_for(db.get_bind()).submit("subscribe", email)
+
+WRITE_BATCH_ENABLED=0 applies each write immediately in the calling thread.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+import models
+
+WRITE_BATCH_ENABLED = os.getenv("WRITE_BATCH_ENABLED", "1") == "1"
+WRITE_BATCH_MAX_DELAY = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "2")) / 1000
+WRITE_BATCH_MAX_ITEMS = int(os.getenv("WRITE_BATCH_MAX_ITEMS", "200"))
+
+
+def _subscribe(conn, emails):
+    table = models.Subscriber.__table__
+    existing = set(conn.scalars(select(table.c.email).where(table.c.email.in_(set(emails)))))
+    results, new = [], []
+    for email in emails:
+        if email in existing:
+            results.append({"message": "Already subscribed"})
+        else:
+            existing.add(email)  # The same email twice in one batch is inserted once
+            new.append({"email": email, "created_at": datetime.utcnow()})
+            results.append({"message": "Subscribed successfully"})
+    if new:
+        conn.execute(insert(table).values(new))
+    return results
+
+
+def _wishlist_match(table, pairs):
+    # OR of (session_id, product_id) pairs: each arm is an equality lookup on both
+    # columns of ix_wishlist_items_session_product (a row-value IN only uses session_id on SQLite)
+    return or_(*[and_(table.c.session_id == s, table.c.product_id == p) for s, p in set(pairs)])
+
+
+def _add_to_wishlist(conn, pairs):
+    table = models.WishlistItem.__table__
+    existing = set(conn.execute(select(table.c.session_id, table.c.product_id).where(_wishlist_match(table, pairs))))
+    results, new = [], []
+    for pair in pairs:
+        if pair in existing:
+            results.append({"message": "Already in wishlist"})
+        else:
+            existing.add(pair)
+            new.append({"session_id": pair[0], "product_id": pair[1], "created_at": datetime.utcnow()})
+            results.append({"message": "Added to wishlist"})
+    if new:
+        conn.execute(insert(table).values(new))
+    return results
+
+
+def _remove_from_wishlist(conn, pairs):
+    table = models.WishlistItem.__table__
+    conn.execute(delete(table).where(_wishlist_match(table, pairs)))
+    return [{"message": "Removed from wishlist"}] * len(pairs)
+
+
+# kind -> handler(conn, [args, ...]) returning one result per write, in order
+HANDLERS = {
+    "subscribe": _subscribe,
+    "wishlist_add": _add_to_wishlist,
+    "wishlist_remove": _remove_from_wishlist,
+}
+
+
+class WriteBatcher:
+    def __init__(self, bind, max_delay=WRITE_BATCH_MAX_DELAY, max_items=WRITE_BATCH_MAX_ITEMS, enabled=WRITE_BATCH_ENABLED):
+        self.bind = bind
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self.enabled = enabled
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind, *args):
+        """Queue one write and wait until it is committed. Returns its result or raises its error."""
+        write = (kind, args, Future())
+        if not self.enabled:
+            self._flush([write])
+        else:
+            self._ensure_thread()
+            self.queue.put(write)
+        return write[2].result()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="write-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                return
+            # The window opens with the first write, so a lone write waits at most max_delay
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                try:
+                    write = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if write is None:
+                    self.queue.put(None)  # Stop once this batch is flushed
+                    break
+                batch.append(write)
+            self._flush(batch)
+
+    def _apply(self, conn, batch):
+        """Run the batch's writes in submission order, one statement set per run of the same kind."""
+        results = []
+        for kind, run in groupby(batch, key=lambda write: write[0]):
+            args = [write[1] if len(write[1]) > 1 else write[1][0] for write in run]
+            results.extend(HANDLERS[kind](conn, args))
+        return results
+
+    def _flush(self, batch, retry=True):
+        try:
+            with self.bind.begin() as conn:
+                results = self._apply(conn, batch)
+        except Exception as error:
+            if isinstance(error, SQLAlchemyError) and retry:
+                # Retry each write once on its own: the retry's SELECT sees rows a
+                # concurrent writer inserted, and a bad write only fails its own request
+                for write in batch:
+                    self._flush([write], retry=False)
+            else:
+                for write in batch:
+                    write[2].set_exception(error)
+            return
+        for write, result in zip(batch, results):
+            write[2].set_result(result)
+
+    def close(self):
+        """Flush what is queued and stop the background thread."""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def batcher_for(bind):
+    """The batcher for an engine (requests may run against an overridden get_db)."""
+    batcher = _batchers.get(bind)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.setdefault(bind, WriteBatcher(bind))
+    return batcher
+
+
+def close_all():
+    for batcher in list(_batchers.values()):
+        batcher.close()
@@ -9,9 +9,11 @@ interface WishlistDrawerProps {
     isOpen: boolean;
     onClose: () => void;
     onAddToCart: (product: Product, quantity: number) => void;
+    wishlistIds: string[] | null;
+    onWishlistChange: (ids: string[]) => void;
 }
 
-const WishlistDrawer: React.FC<WishlistDrawerProps> = ({ isOpen, onClose, onAddToCart }) => {
+const WishlistDrawer: React.FC<WishlistDrawerProps> = ({ isOpen, onClose, onAddToCart, wishlistIds, onWishlistChange }) => {
     const [wishlist, setWishlist] = useState<Product[]>([]);
     const [loading, setLoading] = useState(false);
 
@@ -28,7 +30,11 @@ const WishlistDrawer: React.FC<WishlistDrawerProps> = ({ isOpen, onClose, onAddT
     };
 
     useEffect(() => {
-        if (isOpen) {
+        if (!isOpen) return;
+        // The bootstrap call already told us whether there is anything to load
+        if (wishlistIds !== null && wishlistIds.length === 0) {
+            setWishlist([]);
+        } else {
             loadWishlist();
         }
     }, [isOpen]);
@@ -37,6 +43,7 @@ const WishlistDrawer: React.FC<WishlistDrawerProps> = ({ isOpen, onClose, onAddT
         try {
             await removeFromWishlist(id);
             setWishlist(prev => prev.filter(p => p.id !== id));
+            if (wishlistIds) onWishlistChange(wishlistIds.filter(wishlistId => wishlistId !== String(id)));
         } catch (err) {
             console.error(err);
         }
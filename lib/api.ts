@@ -1,6 +1,50 @@
 import { Product, CartItem } from '../types';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
+// Static catalog written by backend/export_static.py; set to '' to always use the API
+const STATIC_CATALOG_URL = import.meta.env.VITE_STATIC_CATALOG_URL ?? '/catalog';
+
+interface CatalogManifest {
+    version: number;
+    catalog_version?: number;
+    views: Record<string, { file: string; hash: string }>;
+}
+
+let catalogManifest: Promise<CatalogManifest | null> | null = null;
+
+function loadCatalogManifest(revalidate: boolean = false): Promise<CatalogManifest | null> {
+    if (!catalogManifest) {
+        catalogManifest = STATIC_CATALOG_URL
+            ? fetch(`${STATIC_CATALOG_URL}/manifest.json`, revalidate ? { cache: 'no-cache' } : undefined)
+                .then(response => (response.ok ? response.json() : null))
+                .catch(() => null) // Not exported (e.g. local dev): the SPA fallback isn't JSON
+            : Promise.resolve(null);
+    }
+    return catalogManifest;
+}
+
+// Called with the version from /session/bootstrap: if the manifest is older (e.g. a cached
+// copy), fetch it again past the browser cache before anything is read from it
+async function checkCatalogVersion(catalogVersion: string): Promise<void> {
+    const manifest = await loadCatalogManifest();
+    if (manifest?.catalog_version !== undefined && manifest.catalog_version < Number(catalogVersion)) {
+        catalogManifest = null;
+        await loadCatalogManifest(true);
+    }
+}
+
+// Returns null when the view isn't in the static export, so callers fall back to the API
+async function fetchStaticView<T>(key: string): Promise<T | null> {
+    const manifest = await loadCatalogManifest();
+    const entry = manifest?.views[key];
+    if (!entry) return null;
+    try {
+        const response = await fetch(`${STATIC_CATALOG_URL}/${entry.file}`);
+        return response.ok ? response.json() : null;
+    } catch {
+        return null;
+    }
+}
 
 export async function fetchProducts(
     category?: string,
@@ -14,6 +58,10 @@ export async function fetchProducts(
     if (minPrice !== undefined) url.searchParams.append('min_price', minPrice.toString());
     if (maxPrice !== undefined) url.searchParams.append('max_price', maxPrice.toString());
 
+    const query = url.searchParams.toString();
+    const staticView = await fetchStaticView<Product[]>(`products${query ? `?${query}` : ''}`);
+    if (staticView) return staticView;
+
     const response = await fetch(url.toString());
     if (!response.ok) {
         throw new Error('Failed to fetch products');
@@ -22,6 +70,9 @@ export async function fetchProducts(
 }
 
 export async function fetchProduct(id: string): Promise<Product> {
+    const staticView = await fetchStaticView<Product>(`products/${id}`);
+    if (staticView) return staticView;
+
     const response = await fetch(`${API_BASE_URL}/products/${id}`);
     if (!response.ok) {
         throw new Error('Failed to fetch product');
@@ -29,6 +80,28 @@ export async function fetchProduct(id: string): Promise<Product> {
     return response.json();
 }
 
+export interface ProductLiveUpdate {
+    id: number;
+    stock_quantity: number;
+    price: number | null;
+}
+
+// Live stock/price for the given products over one SSE connection; returns an unsubscribe function.
+// onDeleted gets the ids of watched products that no longer exist.
+export function subscribeToProductUpdates(
+    ids: (string | number)[],
+    onUpdate: (updates: ProductLiveUpdate[]) => void,
+    onDeleted?: (ids: number[]) => void
+): () => void {
+    if (ids.length === 0 || typeof EventSource === 'undefined') return () => {};
+    const source = new EventSource(`${API_BASE_URL}/stream/products?ids=${ids.join(',')}`);
+    const handler = (event: MessageEvent) => onUpdate(JSON.parse(event.data));
+    source.addEventListener('snapshot', handler);
+    source.addEventListener('update', handler);
+    source.addEventListener('deleted', (event: MessageEvent) => onDeleted?.(JSON.parse(event.data)));
+    return () => source.close();
+}
+
 export async function addToCart(productId: string, quantity: number): Promise<CartItem> {
     const response = await fetch(`${API_BASE_URL}/cart`, {
         method: 'POST',
@@ -48,6 +121,18 @@ export async function addToCart(productId: string, quantity: number): Promise<Ca
 }
 
 
+// Map a backend cart line ({product_id, quantity, product}) to the frontend structure
+function toCartItem(item: any): CartItem {
+    return {
+        ...item.product, // Spread product details
+        id: item.product ? item.product.id.toString() : item.product_id.toString(),
+        // Map image_url
+        image: item.product?.image_url || item.product?.image,
+
+        quantity: item.quantity,
+    };
+}
+
 export async function getCart(): Promise<CartItem[]> {
     const response = await fetch(`${API_BASE_URL}/cart`, {
         credentials: 'include'
@@ -56,15 +141,41 @@ export async function getCart(): Promise<CartItem[]> {
         throw new Error('Failed to fetch cart');
     }
     const data = await response.json();
-    // Map backend structure to frontend structure
-    return data.map((item: any) => ({
-        ...item.product, // Spread product details
-        id: item.product ? item.product.id.toString() : item.product_id.toString(),
-        // Map image_url
-        image: item.product?.image_url || item.product?.image,
+    return data.map(toCartItem);
+}
 
-        quantity: item.quantity,
-    }));
+export interface SessionBootstrap {
+    cart: CartItem[];
+    wishlist: string[];
+    catalog_version: string;
+}
+
+// Cart lines from bootstrap are {product_id, quantity}: take the products from the static
+// catalog, and ask the API only if there is no export or it lacks one of them
+async function resolveCart(lines: { product_id: number; quantity: number }[]): Promise<CartItem[]> {
+    if (lines.length === 0) return [];
+    const catalog = await fetchStaticView<Product[]>('products');
+    const products = new Map((catalog || []).map(product => [String(product.id), product]));
+    if (!lines.every(line => products.has(String(line.product_id)))) return getCart();
+    return lines.map(line => toCartItem({ ...line, product: products.get(String(line.product_id)) }));
+}
+
+// Everything first paint needs in one request: cart lines and wishlist as product ids, and
+// the catalog version the static catalog is checked against before the cart is read from it
+export async function bootstrapSession(): Promise<SessionBootstrap> {
+    const response = await fetch(`${API_BASE_URL}/session/bootstrap`, {
+        credentials: 'include'
+    });
+    if (!response.ok) {
+        throw new Error('Failed to bootstrap session');
+    }
+    const data = await response.json();
+    await checkCatalogVersion(data.catalog_version);
+    return {
+        cart: await resolveCart(data.cart),
+        wishlist: data.wishlist.map((id: number) => id.toString()),
+        catalog_version: data.catalog_version,
+    };
 }
 
 export async function checkout(customerName: string, email: string, address: string, city: string) {
@@ -96,6 +207,32 @@ export async function searchProducts(query: string): Promise<Product[]> {
     return response.json();
 }
 
+export interface SearchSuggestion {
+    id: number;
+    name: string;
+    slug: string;
+    category: string;
+    price: number;
+    image_url: string;
+}
+
+let searchIndex: Promise<SearchSuggestion[] | null> | null = null;
+
+// Client-side suggestions from the static search index; empty if it wasn't exported
+export async function fetchSearchSuggestions(query: string, limit: number = 8): Promise<SearchSuggestion[]> {
+    const needle = query.trim().toLowerCase();
+    if (!needle) return [];
+    if (!searchIndex) {
+        searchIndex = fetchStaticView<any[][]>('search-index').then(rows =>
+            rows ? rows.map(([id, name, slug, category, price, image_url]) => ({ id, name, slug, category, price, image_url })) : null
+        );
+    }
+    const entries = (await searchIndex) || [];
+    return entries
+        .filter(entry => entry.name.toLowerCase().includes(needle) || (entry.category || '').toLowerCase().includes(needle))
+        .slice(0, limit);
+}
+
 export function getOptimizedImageUrl(url: string, width: number = 800): string {
     if (!url) return '';
     return `${API_BASE_URL}/optimize-image?url=${encodeURIComponent(url)}&width=${width}`;
@@ -2,14 +2,16 @@
 
 import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { fetchProduct, addToWishlist } from '../lib/api';
+import { fetchProduct, addToWishlist, subscribeToProductUpdates } from '../lib/api';
 import { Product } from '../types';
 
 interface Props {
   addToCart: (p: Product, q: number) => void;
+  wishlistIds: string[] | null;
+  onWishlistChange: (ids: string[]) => void;
 }
 
-const ProductDetailPage: React.FC<Props> = ({ addToCart }) => {
+const ProductDetailPage: React.FC<Props> = ({ addToCart, wishlistIds, onWishlistChange }) => {
   const { id } = useParams<{ id: string }>();
   const [product, setProduct] = useState<Product | null>(null);
   const [loading, setLoading] = useState(true);
@@ -37,10 +39,32 @@ const ProductDetailPage: React.FC<Props> = ({ addToCart }) => {
     loadProduct();
   }, [id]);
 
+  useEffect(() => {
+    // Keep stock and price current while the page is open (the catalog copy may be cached)
+    if (!id) return;
+    return subscribeToProductUpdates([id], updates => {
+      const update = updates.find(u => u.id.toString() === id);
+      if (update) {
+        setProduct(prev => prev ? { ...prev, price: update.price ?? prev.price, stock_quantity: update.stock_quantity } : prev);
+      }
+    }, deleted => {
+      if (deleted.some(d => d.toString() === id)) {
+        setProduct(null); // Renders "Product not found."
+      }
+    });
+  }, [id]);
+
+  const isWishlisted = !!id && !!wishlistIds?.includes(id);
+
   const handleAddToWishlist = async () => {
-    if (!product) return;
+    if (!product || !id) return;
+    if (isWishlisted) {
+      alert("Already in your wishlist!");
+      return;
+    }
     try {
       await addToWishlist(product.id);
+      if (wishlistIds) onWishlistChange([...wishlistIds, id]);
       alert("Added to wishlist!");
     } catch (err) {
       console.error(err);
@@ -82,7 +106,7 @@ const ProductDetailPage: React.FC<Props> = ({ addToCart }) => {
               "Witness the golden caramel glaze meeting our sun-ripened Californian almonds in a slow, sensory dance."
             </p>
             <div className="flex gap-4 mt-8">
-              <button onClick={handleAddToWishlist} className="w-10 h-10 rounded-full border border-white/20 flex items-center justify-center hover:bg-white hover:text-black transition-colors"><span className="material-symbols-outlined !text-sm">favorite</span></button>
+              <button onClick={handleAddToWishlist} className="w-10 h-10 rounded-full border border-white/20 flex items-center justify-center hover:bg-white hover:text-black transition-colors"><span className="material-symbols-outlined !text-sm" style={isWishlisted ? { fontVariationSettings: "'FILL' 1" } : undefined}>favorite</span></button>
               <button onClick={handleShare} className="w-10 h-10 rounded-full border border-white/20 flex items-center justify-center hover:bg-white hover:text-black transition-colors"><span className="material-symbols-outlined !text-sm">share</span></button>
             </div>
           </div>
@@ -1,75 +1,422 @@
+"""Multi-scenario load benchmark for the Nutmunch API.
+
+Every virtual user has its own HTTP session (and therefore its own session_id
+cookie, cart and wishlist). Scenario runs arrive open-loop at a fixed average
+rate (Poisson arrivals), independent of how fast the server answers, so a slow
+server shows up as latency instead of silently lowering the offered load.
+
+    # Against a server that is already running
+    python stress_test.py --rate 50 --duration 60
+
+    # Start a local uvicorn on a fresh SQLite fixture, run, stop it
+    python stress_test.py --serve --fixture-products 2000 --rate 100 --duration 30
+
+    # Machine-readable output and regression check against a stored baseline
+    python stress_test.py --serve --out results.json --baseline baseline.json
+    python stress_test.py --serve --save-baseline baseline.json
+
+Exit code 1 means the run regressed against the baseline (or failed to run).
+"""
+import argparse
 import asyncio
-import aiohttp
-import time
+import json
+import os
 import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+CATEGORIES = ["Roasted", "Raw", "Confection", "Reserve"]
+PRICE_RANGES = [(0, 25), (25, 40), (40, 1000)]
+SORTS = [None, "price_asc", "price_desc", "newest"]
+SEARCH_TERMS = ["almond", "pistachio", "cashew", "walnut", "honey", "salt"]
+IMAGE_URL = "https://images.unsplash.com/photo-1506103859296-1c00aa16d99f?q=80&w=2960&auto=format&fit=crop"
+
+# Relative weights of each scenario in the mix (override with --mix name=weight,...)
+DEFAULT_MIX = {
+    "browse": 30,
+    "filter": 20,
+    "search": 10,
+    "quick_look": 15,
+    "add_to_cart": 10,
+    "wishlist": 8,
+    "checkout": 5,
+    "image": 2,
+}
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, session, method, endpoint, url, **kwargs):
+        """Issue one request and record it under `endpoint` (a route label, not the raw URL)."""
+        started = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                await response.read()
+                status = response.status
+        except Exception as e:
+            self.errors[endpoint][type(e).__name__] += 1
+            return None
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        self.statuses[endpoint][status] += 1
+        return status
+
+    def summary(self):
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies[endpoint])
+            statuses = dict(self.statuses[endpoint])
+            total = len(samples) + sum(self.errors[endpoint].values())
+            failed = sum(n for code, n in statuses.items() if code >= 400) + sum(self.errors[endpoint].values())
+            histogram = {}
+            i = 0
+            for bound in LATENCY_BUCKETS_MS:
+                count = 0
+                while i < len(samples) and samples[i] <= bound:
+                    count += 1
+                    i += 1
+                histogram[f"le_{bound}"] = count
+            histogram["le_inf"] = len(samples) - i
+            endpoints[endpoint] = {
+                "requests": total,
+                "error_rate": failed / total if total else 0.0,
+                "statuses": {str(code): n for code, n in sorted(statuses.items())},
+                "exceptions": dict(self.errors[endpoint]),
+                "mean_ms": sum(samples) / len(samples) if samples else None,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": samples[-1] if samples else None,
+                "histogram_ms": histogram,
+            }
+        return endpoints
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    # Nearest-rank percentile
+    rank = max(1, int(round(pct / 100 * len(sorted_samples) + 0.5 - 1e-9)))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+class VirtualUser:
+    def __init__(self, connector, timeout):
+        # Own cookie jar per user: its own session_id, cart and wishlist
+        # unsafe=True: accept cookies from IP hosts like 127.0.0.1
+        self.session = aiohttp.ClientSession(
+            connector=connector, connector_owner=False, timeout=timeout,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+        )
+
+    async def close(self):
+        await self.session.close()
+
+
+async def scenario_browse(user, rec, api, rng, product_ids):
+    await rec.request(user.session, "GET", "GET /api/products", f"{api}/products")
+
+
+async def scenario_filter(user, rec, api, rng, product_ids):
+    low, high = rng.choice(PRICE_RANGES)
+    params = {"category": rng.choice(CATEGORIES), "min_price": low, "max_price": high}
+    sort = rng.choice(SORTS)
+    if sort:
+        params["sort_by"] = sort
+    await rec.request(user.session, "GET", "GET /api/products?filter", f"{api}/products", params=params)
+
+
+async def scenario_search(user, rec, api, rng, product_ids):
+    # Search-as-you-type: one request per keystroke, with human typing gaps
+    term = rng.choice(SEARCH_TERMS)
+    for i in range(1, min(len(term), 5) + 1):
+        await rec.request(user.session, "GET", "GET /api/search", f"{api}/search", params={"q": term[:i]})
+        await asyncio.sleep(rng.uniform(0.05, 0.2))
+
+
+async def scenario_quick_look(user, rec, api, rng, product_ids):
+    await rec.request(user.session, "GET", "GET /api/products/{id}", f"{api}/products/{rng.choice(product_ids)}")
+
+
+async def scenario_add_to_cart(user, rec, api, rng, product_ids):
+    payload = {"product_id": rng.choice(product_ids), "quantity": rng.randint(1, 3)}
+    await rec.request(user.session, "POST", "POST /api/cart", f"{api}/cart", json=payload)
+    await rec.request(user.session, "GET", "GET /api/cart", f"{api}/cart")
+
+
+async def scenario_wishlist(user, rec, api, rng, product_ids):
+    product_id = rng.choice(product_ids)
+    await rec.request(user.session, "POST", "POST /api/wishlist", f"{api}/wishlist", json={"product_id": product_id})
+    await rec.request(user.session, "GET", "GET /api/wishlist", f"{api}/wishlist")
+    if rng.random() < 0.3:
+        await rec.request(user.session, "DELETE", "DELETE /api/wishlist/{id}", f"{api}/wishlist/{product_id}")
 
-BASE_URL = "http://localhost:8000/api"
 
-async def fetch_products(session):
+async def scenario_checkout(user, rec, api, rng, product_ids):
+    payload = {"product_id": rng.choice(product_ids), "quantity": 1}
+    await rec.request(user.session, "POST", "POST /api/cart", f"{api}/cart", json=payload)
+    order = {"customer_name": "Load Test", "email": "load@example.com", "address": "1 Bench St", "city": "Perf"}
+    await rec.request(user.session, "POST", "POST /api/checkout", f"{api}/checkout", json=order)
+
+
+async def scenario_image(user, rec, api, rng, product_ids):
+    await rec.request(user.session, "GET", "GET /api/optimize-image", f"{api}/optimize-image",
+                      params={"url": IMAGE_URL, "width": rng.choice([400, 800])})
+
+
+SCENARIOS = {
+    "browse": scenario_browse,
+    "filter": scenario_filter,
+    "search": scenario_search,
+    "quick_look": scenario_quick_look,
+    "add_to_cart": scenario_add_to_cart,
+    "wishlist": scenario_wishlist,
+    "checkout": scenario_checkout,
+    "image": scenario_image,
+}
+
+
+async def run_load(base_url, rate, duration, users, mix, seed, product_ids):
+    api = f"{base_url.rstrip('/')}/api"
+    rng = random.Random(seed)
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+
+    rec = Recorder()
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(limit=0)
+    pool = [VirtualUser(connector, timeout) for _ in range(users)]
+    in_flight = set()
+    scenario_counts = defaultdict(int)
+    max_lag = 0.0
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    next_arrival = started
     try:
-        async with session.get(f"{BASE_URL}/products") as response:
-            return response.status
-    except Exception as e:
-        return str(e)
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - started >= duration:
+                break
+            delay = next_arrival - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)  # The generator itself fell behind
+
+            name = rng.choices(names, weights)[0]
+            scenario_counts[name] += 1
+            task = asyncio.create_task(
+                SCENARIOS[name](rng.choice(pool), rec, api, random.Random(rng.random()), product_ids)
+            )
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=60)
+    finally:
+        for user in pool:
+            await user.close()
+        await connector.close()
+
+    elapsed = loop.time() - started
+    endpoints = rec.summary()
+    total_requests = sum(e["requests"] for e in endpoints.values())
+    return {
+        "config": {
+            "base_url": base_url, "rate": rate, "duration": duration, "users": users,
+            "mix": mix, "seed": seed,
+        },
+        "elapsed_s": elapsed,
+        "throughput_rps": total_requests / elapsed if elapsed else 0.0,
+        "scenarios": dict(scenario_counts),
+        "generator_max_lag_ms": max_lag * 1000,
+        "endpoints": endpoints,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance, floor_ms):
+    """Return human-readable regressions of p95/p99/error rate against a baseline run."""
+    regressions = []
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            old, new = previous.get(key), current.get(key)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor_ms:
+                regressions.append(f"{endpoint} {key}: {old:.1f} -> {new:.1f} ms")
+        if current["error_rate"] > previous["error_rate"] + 0.01:
+            regressions.append(
+                f"{endpoint} error rate: {previous['error_rate']:.2%} -> {current['error_rate']:.2%}"
+            )
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{results['elapsed_s']:.1f}s, {results['throughput_rps']:.1f} req/s, "
+          f"generator max lag {results['generator_max_lag_ms']:.1f} ms")
+    print(f"Scenarios: {results['scenarios']}")
+    header = f"{'endpoint':<30} {'reqs':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("-" * len(header))
+
+    def ms(value):
+        return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+    for endpoint, e in results["endpoints"].items():
+        print(f"{endpoint:<30} {e['requests']:>7} {e['error_rate'] * 100:>5.1f}% "
+              f"{ms(e['p50_ms'])} {ms(e['p95_ms'])} {ms(e['p99_ms'])} {ms(e['max_ms'])}")
 
-async def add_to_cart(session, session_id):
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_fixture(workdir, products, seed):
+    """Create a SQLite fixture database using the catalog importer. Returns its URL."""
+    rng = random.Random(seed)
+    catalog_path = os.path.join(workdir, "fixture.jsonl")
+    with open(catalog_path, "w") as f:
+        for i in range(products):
+            nut = rng.choice(SEARCH_TERMS)
+            f.write(json.dumps({
+                "name": f"{nut.title()} Selection {i}",
+                "slug": f"{nut}-selection-{i}",
+                "description": f"Fixture {nut} product {i}",
+                "price": round(rng.uniform(5, 60), 2),
+                "category": rng.choice(CATEGORIES),
+                "stock_quantity": 1_000_000,  # Checkouts must not run the fixture out of stock
+                "image_url": IMAGE_URL,
+                "weight": "500g",
+                "grade": rng.choice(["Premium", "Reserve"]),
+                "origin": "Global",
+            }) + "\n")
+    db_url = f"sqlite:///{os.path.join(workdir, 'fixture.db')}"
+    env = fixture_env(workdir, db_url)
+    subprocess.run([sys.executable, "import_catalog.py", catalog_path, "--chunk-size", "10000"],
+                   cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    return db_url
+
+
+def fixture_env(workdir, db_url):
+    return dict(
+        os.environ,
+        DATABASE_URL=db_url,
+        NUTMUNCH_ENV_FILE=os.path.join(workdir, "no-env-file"),  # Never pick up .env.local
+        RATE_LIMIT_ENABLED="0",  # All virtual users share 127.0.0.1
+    )
+
+
+async def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/api/products/1") as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready in {timeout}s")
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (value or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rate", type=float, default=50, help="scenario arrivals per second (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals")
+    parser.add_argument("--users", type=int, default=200, help="virtual users, each with its own cookie jar")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(None), help="e.g. image=0,checkout=10")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--products", type=int, default=12, help="product ids to pick from (1..N)")
+    parser.add_argument("--serve", action="store_true", help="start uvicorn on a fresh SQLite fixture")
+    parser.add_argument("--fixture-products", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --serve")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", help="write results JSON here as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed relative p95/p99 growth")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    server = None
+    workdir = None
+    base_url = args.base_url
+    product_count = args.products
     try:
-        # Simulate adding random product
-        payload = {"product_id": random.randint(1, 6), "quantity": 1}
-        # Note: In real app, session_id is in cookie, but our backend might expect it or we rely on cookie jar if implemented
-        # Current implementation in main.py uses a cookie 'session_id'.
-        async with session.post(f"{BASE_URL}/cart", json=payload) as response:
-            return response.status
-    except Exception as e:
-        return str(e)
-
-async def stress_test(num_requests=100, concurrency=10):
-    print(f"Starting stress test: {num_requests} requests with concurrency {concurrency}")
-    timeout = aiohttp.ClientTimeout(total=10)
-    sem = asyncio.Semaphore(concurrency)
-
-    async def bound_fetch(session):
-        async with sem:
-            return await fetch_products(session)
-
-    async def bound_add(session):
-        async with sem:
-            return await add_to_cart(session, "stress_test_user")
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        # 1. Test Browse (GET)
-        start_time = time.time()
-        tasks = [bound_fetch(session) for _ in range(num_requests)]
-        results = await asyncio.gather(*tasks)
-        duration = time.time() - start_time
-        
-        success_count = results.count(200)
-        failure_count = len(results) - success_count
-        print(f"\n[GET /products]")
-        print(f"Time taken: {duration:.2f}s")
-        print(f"Requests per second: {num_requests/duration:.2f}")
-        print(f"Success: {success_count}, Failures: {failure_count}")
-        if failure_count > 0:
-            print(f"Sample errors: {list(set([r for r in results if r != 200]))[:3]}")
-
-        # 2. Test Write (POST /cart)
-        print(f"\n[POST /cart] (Write Operation)")
-        start_time = time.time()
-        tasks = [bound_add(session) for _ in range(num_requests // 2)] 
-        results = await asyncio.gather(*tasks)
-        duration = time.time() - start_time
-        
-        success_count = results.count(200)
-        failure_count = len(results) - success_count
-        print(f"Time taken: {duration:.2f}s")
-        print(f"Requests per second: {(num_requests // 2)/duration:.2f}")
-        print(f"Success: {success_count}, Failures: {failure_count}")
-        if failure_count > 0:
-            print(f"Sample errors: {list(set([r for r in results if r != 200]))[:3]}")
+        if args.serve:
+            workdir = tempfile.TemporaryDirectory(prefix="nutmunch-load-")
+            print(f"Building fixture with {args.fixture_products} products...")
+            db_url = build_fixture(workdir.name, args.fixture_products, args.seed)
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            product_count = args.fixture_products
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=fixture_env(workdir.name, db_url),
+            )
+            asyncio.run(wait_until_ready(base_url))
+
+        print(f"Load: {args.rate}/s for {args.duration}s, {args.users} users against {base_url}")
+        results = asyncio.run(run_load(
+            base_url, args.rate, args.duration, args.users, args.mix, args.seed,
+            list(range(1, product_count + 1)),
+        ))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=15)
+        if workdir:
+            workdir.cleanup()
+
+    print_report(results)
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.floor_ms)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions vs baseline.")
+    return 0
+
 
 if __name__ == "__main__":
-    # Check if backend is up first
-    try:
-         asyncio.run(stress_test(num_requests=200, concurrency=50))
-    except Exception as e:
-        print(f"Test failed to run: {e}")
+    sys.exit(main())
@@ -11,6 +11,7 @@ export interface Product {
   description: string;
   nutritional_info?: string; // JSON string
   sustainability_info?: string;
+  stock_quantity?: number;
 }
 
 export interface CartItem extends Product {